@@ -0,0 +1,84 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, List
+from config import (
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT,
+    ADMISSION_RETRY_AFTER, DEGRADATION_STEPS
+)
+import metrics
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted; retry_after is in seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Bounded in-flight limit with a bounded wait queue.
+    Requests beyond both limits are rejected immediately; admitted requests get the
+    list of degradation steps active at the current pressure.
+    """
+
+    def __init__(self, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT, retry_after: float = ADMISSION_RETRY_AFTER,
+                 steps: Dict[str, float] = DEGRADATION_STEPS):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        # Steps ordered by the pressure at which they switch on
+        self.steps = sorted(steps.items(), key=lambda item: item[1])
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    def pressure(self) -> float:
+        """Occupancy of in-flight slots plus queue, 0.0 (idle) to 1.0 (full)"""
+        return (self.in_flight + self.waiting) / (self.max_in_flight + self.max_queue)
+
+    def degradation(self) -> List[str]:
+        pressure = self.pressure()
+        return [name for name, threshold in self.steps if pressure >= threshold]
+
+    @asynccontextmanager
+    async def admit(self):
+        if self.in_flight + self.waiting >= self.max_in_flight + self.max_queue:
+            metrics.increment("admission.rejected.queue_full")
+            raise Overloaded("queue full", self.retry_after)
+
+        if self._semaphore.locked():
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                metrics.increment("admission.rejected.queue_timeout")
+                raise Overloaded("queue wait timed out", self.retry_after)
+            finally:
+                self.waiting -= 1
+        else:
+            # A slot is free: take it without suspending
+            await self._semaphore.acquire()
+
+        self.in_flight += 1
+        try:
+            steps = self.degradation()
+            metrics.increment("admission.admitted")
+            for step in steps:
+                metrics.increment(f"admission.degrade.{step}")
+            yield steps
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def state(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "pressure": round(self.pressure(), 3),
+            "active_degradation": self.degradation(),
+        }
+
+admission = AdmissionController()
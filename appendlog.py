@@ -0,0 +1,47 @@
+import atexit
+import queue
+import threading
+from typing import List
+
+class BackgroundAppender:
+    """
+    Appends lines to a file from a background thread so request handlers never
+    block on file I/O. Lines queued while a write is in progress are written
+    together with one open. flush() waits until everything queued is on disk;
+    it also runs at interpreter exit.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def append(self, line: str) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f"append:{self.path}", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+        self._queue.put(line)
+
+    def flush(self) -> None:
+        self._queue.join()
+
+    def _run(self) -> None:
+        while True:
+            lines: List[str] = [self._queue.get()]
+            while True:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.path, "a") as f:
+                    f.write("".join(line + "\n" for line in lines))
+            except OSError as e:
+                print(f"Warning: Could not write {self.path}: {e}")
+            finally:
+                for _ in lines:
+                    self._queue.task_done()
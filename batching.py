@@ -0,0 +1,89 @@
+import asyncio
+import contextvars
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set
+import metrics
+import tracing
+
+class _Batch:
+    __slots__ = ("items", "futures", "enqueued", "usage", "spans")
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.futures: List[asyncio.Future] = []
+        self.enqueued: List[float] = []
+        # Token ledger and trace spans of the batch run, shared out to the submitters
+        self.usage: Dict[str, Dict[str, int]] = {}
+        self.spans: List[tracing.Span] = []
+
+def _share(total: int, index: int, count: int) -> int:
+    """Item index's part of total split evenly over count items; the parts sum to total"""
+    return total // count + (index < total % count)
+
+class MicroBatcher:
+    """
+    Collects items submitted under the same key for up to window_ms (or until
+    max_size items) and runs them together: run_batch(key, items) returns one
+    result per item, in order. Each submitter awaits only its own result.
+    The batch runs outside any request's context; each submitter then gets an even
+    share of its token usage in its ledger and a copy of its spans in its trace.
+    """
+
+    def __init__(self, window_ms: float, max_size: int, run_batch: Callable[[Hashable, List[Any]], Awaitable[List[Any]]]):
+        self.window = window_ms / 1000
+        self.max_size = max_size
+        self.run_batch = run_batch
+        self._open: Dict[Hashable, _Batch] = {}
+        self._running: Set[asyncio.Task] = set()
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        batch = self._open.get(key)
+        if batch is None:
+            batch = self._open[key] = _Batch()
+            loop.call_later(self.window, self._close, key, batch)
+        future = loop.create_future()
+        index = len(batch.items)
+        batch.items.append(item)
+        batch.futures.append(future)
+        batch.enqueued.append(time.perf_counter())
+        if len(batch.items) >= self.max_size:
+            self._close(key, batch)
+        with tracing.span("batch.wait", key=str(key)) as span:
+            try:
+                return await future
+            finally:
+                size = len(batch.items)
+                span.set(batch_size=size)
+                for stage, tokens in batch.usage.items():
+                    metrics.record_request_usage(stage, _share(tokens["prompt_tokens"], index, size),
+                                                 _share(tokens["completion_tokens"], index, size))
+                tracing.adopt(batch.spans, batch_size=size)
+
+    def _close(self, key: Hashable, batch: _Batch) -> None:
+        # The window timer may fire after the batch already closed on max_size
+        if self._open.get(key) is not batch:
+            return
+        del self._open[key]
+        # A fresh context keeps the batch's usage and spans out of whichever request closed it
+        task = contextvars.Context().run(asyncio.get_running_loop().create_task, self._run(key, batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, key: Hashable, batch: _Batch) -> None:
+        batch.usage = metrics.begin_request_usage()
+        batch.spans = tracing.begin_trace().spans
+        started = time.perf_counter()
+        metrics.observe("batch.size", len(batch.items))
+        for enqueued in batch.enqueued:
+            metrics.observe("batch.queue_delay_ms", (started - enqueued) * 1000)
+        try:
+            results = await self.run_batch(key, batch.items)
+        except Exception as e:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in zip(batch.futures, results):
+            if not future.done():
+                future.set_result(result)
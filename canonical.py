@@ -0,0 +1,162 @@
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from datetime import date, timedelta
+from threading import Lock
+from typing import List, Optional, Tuple
+from config import CANONICAL_STATS_MAX_KEYS, CANONICAL_STATS_MAX_VARIANTS
+from gazetteer import lookup_state, resolve_location
+from gittertalk import AnyGittertalk, CompactGittertalk, LOCATION_ABBREVIATIONS, gittertalk_params, gittertalk_to_string
+import metrics
+
+# Params holding a place or a day; everything else is only case and whitespace normalized
+LOCATION_KEYS = {"from", "to", "location", "origin", "destination", "city"}
+DATE_KEYS = {"when", "date", "day", "depart", "return"}
+
+# Level-2 abbreviations back to the place they stand for ("lax" -> "Los Angeles")
+_ABBREVIATION_PLACES = {short.lower(): place for place, short in LOCATION_ABBREVIATIONS.items()}
+
+_WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_DAY_OFFSETS = {"today": 0, "tonight": 0, "now": 0, "tomorrow": 1, "tmrw": 1, "yesterday": -1}
+# "+3", "3 days", "in 2 weeks"; a bare number ("10") is not a date offset
+_IN_DAYS_RE = re.compile(r"^(?:in\s+)?(\+)?(\d+)\s*(d|day|days|w|week|weeks)?$")
+
+def canonical_location(value: str) -> str:
+    """
+    Title-cased canonical city, with ", ST" kept when a state was given. A region
+    that is not a US state ("Toronto, Canada") is kept as written.
+    """
+    place = _ABBREVIATION_PLACES.get(value.strip().lower())
+    if place:
+        return place
+    city, state = resolve_location(value)
+    city = " ".join(city.split()).title()
+    if "," in value:
+        region = " ".join(value.partition(",")[2].split(",")[0].split())
+        if region and not lookup_state(region):
+            state = region
+    return f"{city}, {state}" if state else city
+
+def resolve_date(value: str, reference_date: date) -> Optional[str]:
+    """ISO date for a relative day ("tomorrow", "+3", "next friday", "weekend"), or None"""
+    text = value.lower()
+    if text in _DAY_OFFSETS:
+        return (reference_date + timedelta(days=_DAY_OFFSETS[text])).isoformat()
+    match = _IN_DAYS_RE.match(text)
+    if match and (match.group(1) or match.group(3)):
+        days = int(match.group(2)) * (7 if (match.group(3) or "d").startswith("w") else 1)
+        return (reference_date + timedelta(days=days)).isoformat()
+
+    words = text.split()
+    skip_week = words[0] == "next" and len(words) > 1
+    if words[0] in ("this", "next") and len(words) > 1:
+        words = words[1:]
+    if len(words) != 1:
+        return None
+    word = words[0]
+    if word == "week" and skip_week:
+        # "next week" starts on the coming Monday
+        return (reference_date + timedelta(days=7 - reference_date.weekday())).isoformat()
+    if word == "weekend":
+        target = 5
+    elif word in _WEEKDAYS:
+        target = _WEEKDAYS.index(word)
+    else:
+        return None
+    # Nearest upcoming occurrence; "next friday" is the one after that only when it falls this week
+    days = (target - reference_date.weekday()) % 7
+    if skip_week and days == 0:
+        days = 7
+    return (reference_date + timedelta(days=days)).isoformat()
+
+def canonical_date(value: str, reference_date: date) -> str:
+    """Resolve the leading relative day of a value, keeping any time-of-day words after it"""
+    words = value.split()
+    # Longest leading phrase that resolves: "next friday evening" -> "<date> evening"
+    for size in range(min(len(words), 3), 0, -1):
+        resolved = resolve_date(" ".join(words[:size]), reference_date)
+        if resolved:
+            return " ".join([resolved] + words[size:])
+    return value
+
+def canonical_value(key: str, value: str, reference_date: date) -> str:
+    value = " ".join(str(value).split())
+    if key in LOCATION_KEYS and value:
+        return canonical_location(value)
+    value = value.lower()
+    if key in DATE_KEYS and value:
+        return canonical_date(value, reference_date)
+    return value
+
+def canonicalize(gt: AnyGittertalk, reference_date: Optional[date] = None) -> CompactGittertalk:
+    """
+    Canonical form of a gittertalk object, so equivalent requests share cache and
+    coalescing keys: lowercase act/obj/keys, aliased locations, relative dates resolved
+    against reference_date (default today) and params sorted by key.
+    """
+    reference_date = reference_date or date.today()
+    params = {}
+    for key, value in gittertalk_params(gt).items():
+        key = " ".join(str(key).lower().split())
+        params[key] = canonical_value(key, value, reference_date)
+    canonical = CompactGittertalk(
+        " ".join(gt.act.lower().split()), " ".join(gt.obj.lower().split()), tuple(sorted(params.items()))
+    )
+    variants.record(gt, canonical)
+    return canonical
+
+def canonical_key(gt: CompactGittertalk) -> str:
+    """Stable hash of a canonical gittertalk, identical across processes and restarts"""
+    serialized = json.dumps([gt.act, gt.obj, [list(pair) for pair in gt.params]], separators=(",", ":"))
+    return hashlib.sha1(serialized.encode("utf-8")).hexdigest()
+
+class VariantStats:
+    """
+    How many distinct raw gittertalk strings mapped to each canonical form.
+    Bounded: least recently seen canonical forms are evicted, and each form keeps
+    at most max_variants raw strings (the count stops growing there).
+    """
+
+    def __init__(self, max_keys: int = CANONICAL_STATS_MAX_KEYS, max_variants: int = CANONICAL_STATS_MAX_VARIANTS):
+        self.max_keys = max_keys
+        self.max_variants = max_variants
+        self._forms: "OrderedDict[str, Tuple[CompactGittertalk, set, List[int]]]" = OrderedDict()
+        self._lock = Lock()
+
+    def record(self, raw: AnyGittertalk, canonical: CompactGittertalk) -> None:
+        raw_string = gittertalk_to_string(raw, 1)
+        key = canonical_key(canonical)
+        with self._lock:
+            entry = self._forms.get(key)
+            if entry is None:
+                entry = self._forms[key] = (canonical, set(), [0])
+                while len(self._forms) > self.max_keys:
+                    self._forms.popitem(last=False)
+            else:
+                self._forms.move_to_end(key)
+            _, raw_strings, requests = entry
+            requests[0] += 1
+            if raw_string not in raw_strings and len(raw_strings) < self.max_variants:
+                raw_strings.add(raw_string)
+        metrics.increment("canonical.requests")
+        if raw_string != gittertalk_to_string(canonical, 1):
+            metrics.increment("canonical.rewritten")
+
+    def summary(self, top: int = 10) -> dict:
+        with self._lock:
+            forms = sorted(self._forms.items(), key=lambda item: len(item[1][1]), reverse=True)
+            return {
+                "forms": len(self._forms),
+                "top": [
+                    {"key": key, "gittertalk": gittertalk_to_string(canonical, 1),
+                     "variants": len(raw_strings), "requests": requests[0]}
+                    for key, (canonical, raw_strings, requests) in forms[:top]
+                ],
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._forms.clear()
+
+variants = VariantStats()
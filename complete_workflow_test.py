@@ -2,13 +2,18 @@
 """
 Complete token efficiency test - measures both string compression AND pipeline efficiency
 """
-import tiktoken
+from functools import lru_cache
 from gittertalk import gittertalk, gittertalk_to_string
 
+@lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-3.5-turbo"):
+    """Load the tiktoken encoding on first use (tiktoken is slow to import)"""
+    import tiktoken
+    return tiktoken.encoding_for_model(model)
+
 def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
     """Count tokens using OpenAI's tiktoken library"""
-    encoding = tiktoken.encoding_for_model(model)
-    return len(encoding.encode(text))
+    return len(get_encoding(model).encode(text))
 
 def test_complete_workflow():
     """Test ACTUAL workflow token efficiency: user→AI vs user→gittertalk→AI"""
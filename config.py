@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -6,4 +7,107 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 MODEL_FEEDER = "gpt-3.5-turbo"
 MODEL_INTERPRETER = "gpt-3.5-turbo"
-MODEL_DEPARTMENT = "gpt-3.5-turbo"
\ No newline at end of file
+MODEL_DEPARTMENT = "gpt-3.5-turbo"
+
+# Shared async upstream client, built on first use so importing the app stays cheap
+# and does not require OPENAI_API_KEY until a request is actually served
+_openai_client = None
+
+def get_openai_client():
+    global _openai_client
+    if _openai_client is None:
+        from openai import AsyncOpenAI
+        _openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    return _openai_client
+
+def set_openai_client(client) -> None:
+    """Replace the shared upstream client (e.g. with a local stand-in for benchmarks)."""
+    global _openai_client
+    _openai_client = client
+
+# Interpreter output: "json" (compact schema-constrained reply) or "text" (legacy line format)
+INTERPRETER_OUTPUT_MODE = os.getenv("INTERPRETER_OUTPUT_MODE", "json").lower()
+
+# Department completion budgets (max_tokens). Unlisted adaptive departments use "adaptive".
+# Override with DEPARTMENT_TOKEN_BUDGETS='{"travel": 200, "weather": 150}'
+DEPARTMENT_TOKEN_BUDGETS = {
+    "travel": 350, "news": 400, "joke": 120, "adaptive": 300, "generic": 250
+}
+DEPARTMENT_TOKEN_BUDGETS.update(json.loads(os.getenv("DEPARTMENT_TOKEN_BUDGETS", "{}")))
+# Budgets shrink proportionally once more than this many department calls are in flight
+DEPARTMENT_LOAD_THRESHOLD = int(os.getenv("DEPARTMENT_LOAD_THRESHOLD", "8"))
+DEPARTMENT_MIN_TOKENS = int(os.getenv("DEPARTMENT_MIN_TOKENS", "64"))
+
+# Multi-turn sessions: last gittertalk per session, bounded and expiring
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+
+# Pre-build clients, codec tables and tokenizers before the worker reports ready
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+# Multi-intent requests: at most this many gittertalk/department pairs are dispatched
+MAX_INTENTS = int(os.getenv("MAX_INTENTS", "4"))
+# Structured interpreter completion cap: one compact object is about 25 tokens, so the
+# default leaves room for MAX_INTENTS of them plus the {"i":[...]} wrapper
+INTERPRETER_TOKENS_PER_INTENT = int(os.getenv("INTERPRETER_TOKENS_PER_INTENT", "30"))
+INTERPRETER_MAX_TOKENS = int(os.getenv("INTERPRETER_MAX_TOKENS", str(INTERPRETER_TOKENS_PER_INTENT * MAX_INTENTS + 10)))
+
+# Department response cache: TTL per department (0 disables); unpromoted adaptive departments are not cached
+DEPARTMENT_CACHE_TTL_SECONDS = {"travel": 300, "news": 60, "joke": 600}
+DEPARTMENT_CACHE_TTL_SECONDS.update(json.loads(os.getenv("DEPARTMENT_CACHE_TTL_SECONDS", "{}")))
+DEPARTMENT_CACHE_MAX_ENTRIES = int(os.getenv("DEPARTMENT_CACHE_MAX_ENTRIES", "5000"))
+
+# Adaptive departments seen this many times are promoted to persisted profiles
+DEPARTMENT_PROFILES_PATH = os.getenv("DEPARTMENT_PROFILES_PATH", "department_profiles.json")
+PROFILE_PROMOTION_THRESHOLD = int(os.getenv("PROFILE_PROMOTION_THRESHOLD", "5"))
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "300"))
+# At most this many profiles; request counts are kept for the most recently seen names only
+PROFILE_MAX_COUNT = int(os.getenv("PROFILE_MAX_COUNT", "100"))
+PROFILE_TRACKED_NAMES = int(os.getenv("PROFILE_TRACKED_NAMES", "10000"))
+
+# Local department router: trained with `python router.py train <log>`; overrides the interpreter above the threshold
+ROUTER_MODEL_PATH = os.getenv("ROUTER_MODEL_PATH", "router_model.json")
+ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.9"))
+# Append feeder outputs and interpreter departments here to build training data (empty disables)
+ROUTER_LOG_PATH = os.getenv("ROUTER_LOG_PATH", "")
+
+# Admission control for /process: in-flight limit, bounded wait queue and fast rejection
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+ADMISSION_RETRY_AFTER = float(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+ADMISSION_REJECT_STATUS = int(os.getenv("ADMISSION_REJECT_STATUS", "503"))  # 503 or 429
+# Degradation step -> pressure (in-flight + queued over capacity) at which it switches on
+# verbose_4 only changes the returned gittertalk format; departments always read level 2
+DEGRADATION_STEPS = {"fast_path": 0.5, "verbose_4": 0.6, "tight_budgets": 0.75, "stale_cache": 0.9}
+DEGRADATION_STEPS.update(json.loads(os.getenv("DEGRADATION_STEPS", "{}")))
+DEGRADED_BUDGET_SCALE = float(os.getenv("DEGRADED_BUDGET_SCALE", "0.5"))
+
+# Canonicalize gittertalk (case, location aliases, relative dates, param order) before department dispatch
+CANONICALIZE_GITTERTALK = os.getenv("CANONICALIZE_GITTERTALK", "true").lower() == "true"
+CANONICAL_STATS_MAX_KEYS = int(os.getenv("CANONICAL_STATS_MAX_KEYS", "10000"))
+CANONICAL_STATS_MAX_VARIANTS = int(os.getenv("CANONICAL_STATS_MAX_VARIANTS", "64"))
+
+# Async jobs (POST /jobs): worker pool size, pending queue bound, stored jobs and result lifetime
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "4"))
+JOBS_MAX_QUEUE = int(os.getenv("JOBS_MAX_QUEUE", "1000"))
+JOBS_MAX_ENTRIES = int(os.getenv("JOBS_MAX_ENTRIES", "10000"))
+JOBS_RESULT_TTL_SECONDS = float(os.getenv("JOBS_RESULT_TTL_SECONDS", "600"))
+JOBS_CALLBACK_TIMEOUT = float(os.getenv("JOBS_CALLBACK_TIMEOUT", "5"))
+
+# Tracing: append finished request traces here as OTLP/JSON lines (empty disables export)
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "transdepo-api")
+
+# Micro-batching of built-in department calls: collect same-department requests for this long (0 disables)
+DEPARTMENT_BATCH_WINDOW_MS = float(os.getenv("DEPARTMENT_BATCH_WINDOW_MS", "0"))
+DEPARTMENT_BATCH_MAX_SIZE = int(os.getenv("DEPARTMENT_BATCH_MAX_SIZE", "8"))
+
+# Near-duplicate request cache: reuse the interpreter result (and optionally the department response)
+# of a recent request with the same content words whose normalized text is at least
+# NEARDUP_THRESHOLD similar; opt-in
+NEARDUP_ENABLED = os.getenv("NEARDUP_ENABLED", "false").lower() == "true"
+NEARDUP_THRESHOLD = float(os.getenv("NEARDUP_THRESHOLD", "0.8"))
+NEARDUP_MAX_ENTRIES = int(os.getenv("NEARDUP_MAX_ENTRIES", "100000"))
+NEARDUP_TTL_SECONDS = float(os.getenv("NEARDUP_TTL_SECONDS", "600"))
+NEARDUP_REUSE_RESPONSE = os.getenv("NEARDUP_REUSE_RESPONSE", "false").lower() == "true"
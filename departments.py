@@ -1,22 +1,79 @@
-from openai import OpenAI
-from config import OPENAI_API_KEY, MODEL_DEPARTMENT
-from typing import TYPE_CHECKING
+import asyncio
+import re
+import time
+from config import (
+    get_openai_client, MODEL_DEPARTMENT, DEPARTMENT_TOKEN_BUDGETS,
+    DEPARTMENT_LOAD_THRESHOLD, DEPARTMENT_MIN_TOKENS,
+    DEPARTMENT_CACHE_TTL_SECONDS, DEPARTMENT_CACHE_MAX_ENTRIES,
+    DEPARTMENT_BATCH_WINDOW_MS, DEPARTMENT_BATCH_MAX_SIZE
+)
+from typing import TYPE_CHECKING, List, Optional, Tuple
+from batching import MicroBatcher
+from cache import TTLCache
+from profiles import BUILTIN_DEPARTMENTS, normalize_department, profiles
+import metrics
+import tracing
 
 if TYPE_CHECKING:
-    from gittertalk import gittertalk
+    from gittertalk import AnyGittertalk
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Number of department completions currently in flight, used to shrink budgets under load
+_in_flight = 0
 
-def extract_user_intent(gittertalk_obj: "gittertalk") -> str:
+# Department responses keyed by (department, CompactGittertalk)
+department_cache = TTLCache(DEPARTMENT_CACHE_MAX_ENTRIES)
+
+# Built-in department prompts: (assistant role, request kind, task instructions)
+BUILTIN_PROMPTS = {
+    "travel": ("Travel", "travel", "provide helpful travel advice or booking suggestions. Be friendly and professional."),
+    "news": ("News", "news", "provide news updates or information. Be informative and helpful."),
+    "joke": ("Comedy", "entertainment", "provide humor or entertainment. Be funny and engaging."),
+}
+
+# Marker line that opens each item of a batched department call
+_BATCH_MARKER_RE = re.compile(r"^\s*#{3}\s*(\d+)\s*$", re.MULTILINE)
+
+def department_prompt(department: str, gittertalk_str: str) -> str:
+    role, kind, task = BUILTIN_PROMPTS[department]
+    return (
+        f"You are a {role} Assistant AI. Process this {kind} request: {gittertalk_str}\n"
+        f"Interpret the compact request format and {task}"
+    )
+
+def batch_prompt(department: str) -> str:
+    """Shared system prompt for a batch; the numbered items follow as the user message."""
+    role, kind, task = BUILTIN_PROMPTS[department]
+    return (
+        f"You are a {role} Assistant AI. Process each numbered {kind} request below.\n"
+        f"Interpret the compact request format and {task}\n"
+        "Answer every request in order, each under its own '### <number>' line."
+    )
+
+def split_batch_answers(content: str, count: int) -> Optional[List[str]]:
+    """Answers of a batched reply in item order, or None unless items 1..count each got one."""
+    markers = list(_BATCH_MARKER_RE.finditer(content))
+    if [int(m.group(1)) for m in markers] != list(range(1, count + 1)):
+        return None
+    answers = []
+    for marker, following in zip(markers, markers[1:] + [None]):
+        answer = content[marker.end():following.start() if following else len(content)].strip()
+        if not answer:
+            return None
+        answers.append(answer)
+    return answers
+
+def extract_user_intent(gittertalk_obj: "AnyGittertalk") -> str:
     """
     Convert gittertalk object back to user-friendly language for processing.
     This ensures that department AIs never see internal technical terms.
     """
+    from gittertalk import gittertalk_params
+    
     try:
         # Build a natural language description from gittertalk components
         action = gittertalk_obj.act
         obj = gittertalk_obj.obj
-        params = gittertalk_obj.params or {}
+        params = gittertalk_params(gittertalk_obj)
         
         # Start with the basic action and object
         if action and obj:
@@ -62,7 +119,75 @@ def extract_user_intent(gittertalk_obj: "gittertalk") -> str:
         # Fallback to a generic description if parsing fails
         return "help with a user request"
 
-async def handle_department(department: str, gittertalk_obj: "gittertalk", fallback_mode: str = "adaptive") -> str:
+def base_budget(department: str, profile: Optional[dict] = None) -> int:
+    """Configured budget of a department, or its promoted profile's, before any per-request or load adjustment"""
+    budget = DEPARTMENT_TOKEN_BUDGETS.get(department)
+    if not budget:
+        budget = profile["token_budget"] if profile else DEPARTMENT_TOKEN_BUDGETS["adaptive"]
+    return budget
+
+def requested_budget(department: str, requested: Optional[int] = None, profile: Optional[dict] = None) -> int:
+    """
+    Configured department budget or the promoted profile's budget, lowered to the
+    per-request value if that is smaller (a request can never raise a department's budget).
+    """
+    budget = base_budget(department, profile)
+    return min(requested, budget) if requested else budget
+
+def department_budget(department: str, requested: Optional[int] = None, profile: Optional[dict] = None,
+                      scale: float = 1.0) -> int:
+    """
+    Output token budget for a department call.
+    Starts from requested_budget, multiplied by scale (load shedding), and
+    shrinks proportionally once more than DEPARTMENT_LOAD_THRESHOLD calls are in flight,
+    but never below DEPARTMENT_MIN_TOKENS because of load alone.
+    """
+    budget = requested_budget(department, requested, profile)
+    if scale != 1.0:
+        budget = max(int(budget * scale), min(budget, DEPARTMENT_MIN_TOKENS))
+    if _in_flight > DEPARTMENT_LOAD_THRESHOLD:
+        shrunk = budget * DEPARTMENT_LOAD_THRESHOLD // _in_flight
+        budget = max(shrunk, min(budget, DEPARTMENT_MIN_TOKENS))
+        metrics.increment("department.budget.shrunk")
+    return budget
+
+async def complete_department(prompt: str, department: str, max_tokens: int,
+                              user_message: Optional[str] = None) -> Tuple[str, int]:
+    """
+    Run one department completion under a token budget.
+    Returns the response text and the completion tokens actually used.
+    """
+    messages = [{"role": "system", "content": prompt}]
+    if user_message is not None:
+        messages.append({"role": "user", "content": user_message})
+    global _in_flight
+    _in_flight += 1
+    started = time.perf_counter()
+    try:
+        with tracing.span("upstream", "client", stage="department", model=MODEL_DEPARTMENT,
+                          department=department, max_tokens=max_tokens) as span:
+            response = await get_openai_client().chat.completions.create(
+                model=MODEL_DEPARTMENT,
+                messages=messages,
+                max_tokens=max_tokens
+            )
+            span.set_usage(response.usage)
+            span.set(finish_reason=response.choices[0].finish_reason)
+    finally:
+        _in_flight -= 1
+    metrics.observe(f"department.{department}.latency_ms", (time.perf_counter() - started) * 1000)
+    
+    completion_tokens = response.usage.completion_tokens if response.usage else 0
+    metrics.observe(f"department.{department}.completion_tokens", completion_tokens)
+    metrics.record_usage("department", response.usage)
+    if response.choices[0].finish_reason == "length":
+        metrics.increment(f"department.{department}.budget_exhausted")
+    return response.choices[0].message.content.strip(), completion_tokens
+
+@tracing.traced("department")
+async def handle_department(department: str, gittertalk_obj: "AnyGittertalk", fallback_mode: str = "adaptive",
+                            max_tokens: Optional[int] = None, budget_scale: float = 1.0,
+                            allow_stale: bool = False) -> Tuple[str, dict]:
     """
     Routes the gittertalk to the appropriate department AI and gets the response.
     
@@ -70,84 +195,157 @@ async def handle_department(department: str, gittertalk_obj: "gittertalk", fallb
         department: The department name suggested by the interpreter
         gittertalk_obj: The parsed gittertalk object
         fallback_mode: "adaptive" (creates new dept) or "strict" (refuses unknown depts)
+        max_tokens: Optional per-request output budget, capped at the department default
+        budget_scale: Multiplier applied to the budget while shedding load
+        allow_stale: Serve expired department cache entries while shedding load
+    
+    Returns:
+        The response text and a usage dict with the budget, completion tokens used
+        and whether the response came from the department cache; "fallback": "generic"
+        marks an answer from the generic department after the department call failed.
     """
+    from gittertalk import CompactGittertalk
+    
+    department = normalize_department(department)
+    metrics.increment(f"department.{department}.requests")
+    span = tracing.current_span()
+    span.set(department=department, fallback_mode=fallback_mode)
+    
+    # Frequent adaptive departments are promoted to profiles with their own prompt, budget and cache policy
+    profile = None
+    if department not in BUILTIN_DEPARTMENTS and fallback_mode == "adaptive":
+        profile = profiles.record_request(department)
+    budget = department_budget(department, max_tokens, profile, budget_scale)
+    span.set(token_budget=budget)
+    
+    cache_ttl = department_cache_ttl(department, profile)
+    cache_key = None
+    if cache_ttl > 0:
+        compact = gittertalk_obj if isinstance(gittertalk_obj, CompactGittertalk) else CompactGittertalk.from_model(gittertalk_obj)
+        # Keyed on the budget before load shedding, so a reply stays reusable while budgets shrink;
+        # a per-request max_tokens reply is also tried at the full budget
+        cache_key = (department, compact, requested_budget(department, max_tokens, profile))
+        keys = [cache_key]
+        if cache_key[2] != base_budget(department, profile):
+            keys.append((department, compact, base_budget(department, profile)))
+        with tracing.span("cache.lookup", cache="department", department=department) as lookup:
+            cached = cached_reply(keys, budget)
+            if cached is None and allow_stale:
+                cached = cached_reply(keys, budget, allow_stale=True)
+                if cached is not None:
+                    metrics.increment("department.cache_stale_served")
+                    lookup.set(stale=True)
+            lookup.set(hit=cached is not None)
+        span.set(cached=cached is not None)
+        if cached is not None:
+            metrics.increment(f"department.{department}.cache_hit")
+            return cached, {"token_budget": budget, "completion_tokens": 0, "cached": True}
+        metrics.increment(f"department.{department}.cache_miss")
+    
     # Route to the appropriate department based on the department name
     try:
         if department == "travel":
-            return await travel_department(gittertalk_obj)
+            result, used = await travel_department(gittertalk_obj, budget)
         elif department == "news":
-            return await news_department(gittertalk_obj)
+            result, used = await news_department(gittertalk_obj, budget)
         elif department == "joke":
-            return await joke_department(gittertalk_obj)
+            result, used = await joke_department(gittertalk_obj, budget)
+        elif profile is not None:
+            result, used = await profile_department(gittertalk_obj, profile, budget)
         elif fallback_mode == "adaptive":
-            return await adaptive_fallback_department(gittertalk_obj, department)
+            result, used = await adaptive_fallback_department(gittertalk_obj, department, budget)
+            profiles.record_usage(department, used)
         else:  # strict mode
-            available_departments = ["travel", "news", "joke"]
-            return await strict_fallback_department(department, available_departments)
+            result, used = await strict_fallback_department(department, BUILTIN_DEPARTMENTS)
     except Exception as e:
         # Fallback to generic department if there's an error
-        return await generic_department(gittertalk_obj)
-
-async def travel_department(gittertalk_obj: "gittertalk") -> str:
-    # Use the gittertalk object directly for token efficiency - don't expand back to natural language
-    from gittertalk import gittertalk_to_string
-    
-    # Get the compressed gittertalk string at the same level it was created
-    # This maintains the token efficiency benefit
-    gittertalk_str = gittertalk_to_string(gittertalk_obj, 2)  # Use level 2 as baseline for departments
+        budget = department_budget("generic", max_tokens, scale=budget_scale)
+        span.set(fallback="generic", fallback_reason=f"{type(e).__name__}: {e}")
+        result, used = await generic_department(gittertalk_obj, budget)
+        span.set(completion_tokens=used)
+        return result, {"token_budget": budget, "completion_tokens": used, "cached": False, "fallback": "generic"}
     
-    prompt = (
-        f"You are a Travel Assistant AI. Process this travel request: {gittertalk_str}\n"
-        "Interpret the compact request format and provide helpful travel advice or booking suggestions. "
-        "Be friendly and professional."
-    )
-    response = client.chat.completions.create(
-        model=MODEL_DEPARTMENT,
-        messages=[
-            {"role": "system", "content": prompt}
-        ]
-    )
-    return response.choices[0].message.content.strip()
+    if cache_key is not None:
+        # A reply that used the whole budget was cut off (finish_reason "length"); don't keep it
+        if used < budget:
+            department_cache.put(cache_key, (result, used), cache_ttl)
+        else:
+            metrics.increment(f"department.{department}.cache_skipped_truncated")
+    span.set(completion_tokens=used)
+    return result, {"token_budget": budget, "completion_tokens": used, "cached": False}
 
-async def news_department(gittertalk_obj: "gittertalk") -> str:
-    # Use the gittertalk object directly for token efficiency
-    from gittertalk import gittertalk_to_string
-    
-    gittertalk_str = gittertalk_to_string(gittertalk_obj, 2)
+def cached_reply(keys: List[tuple], budget: int, allow_stale: bool = False) -> Optional[str]:
+    """First cached reply under keys whose completion fits within budget"""
+    for key in keys:
+        entry = department_cache.get(key, allow_stale=allow_stale)
+        if entry is not None and entry[1] <= budget:
+            return entry[0]
+    return None
+
+async def run_department_batch(department: str, items: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
+    """
+    One upstream call for several (gittertalk string, budget) items of a built-in
+    department, split back per item. Falls back to individual calls when the
+    reply cannot be split.
+    """
+    if len(items) == 1:
+        gittertalk_str, max_tokens = items[0]
+        return [await complete_department(department_prompt(department, gittertalk_str), department, max_tokens)]
     
-    prompt = (
-        f"You are a News Assistant AI. Process this news request: {gittertalk_str}\n"
-        "Interpret the compact request format and provide news updates or information. "
-        "Be informative and helpful."
-    )
-    response = client.chat.completions.create(
-        model=MODEL_DEPARTMENT,
-        messages=[
-            {"role": "system", "content": prompt}
-        ]
+    system_prompt = batch_prompt(department)
+    user_message = "\n".join(f"### {i}\n{gittertalk_str}" for i, (gittertalk_str, _) in enumerate(items, 1))
+    content, completion_tokens = await complete_department(
+        system_prompt, department, sum(max_tokens for _, max_tokens in items), user_message
     )
-    return response.choices[0].message.content.strip()
+    answers = split_batch_answers(content, len(items))
+    if answers is None:
+        metrics.increment(f"department.{department}.batch_split_failed")
+        print(f"Warning: Could not split batched {department} reply into {len(items)} answers; retrying individually")
+        return list(await asyncio.gather(*(
+            complete_department(department_prompt(department, gittertalk_str), department, max_tokens)
+            for gittertalk_str, max_tokens in items
+        )))
+    
+    # Prompt characters the batch avoided sending, at the ~4 characters per token used elsewhere
+    individual_chars = sum(len(department_prompt(department, gittertalk_str)) for gittertalk_str, _ in items)
+    metrics.observe("batch.prompt_tokens_saved", max(individual_chars - len(system_prompt) - len(user_message), 0) // 4)
+    total_chars = sum(len(answer) for answer in answers)
+    if completion_tokens >= sum(max_tokens for _, max_tokens in items):
+        # The batch reply was cut off; report every item as having used its whole budget
+        return [(answer, max_tokens) for answer, (_, max_tokens) in zip(answers, items)]
+    return [(answer, completion_tokens * len(answer) // total_chars) for answer in answers]
+
+department_batcher = MicroBatcher(DEPARTMENT_BATCH_WINDOW_MS, DEPARTMENT_BATCH_MAX_SIZE, run_department_batch)
 
-async def joke_department(gittertalk_obj: "gittertalk") -> str:
-    # Use the gittertalk object directly for token efficiency  
+async def builtin_department(department: str, gittertalk_obj: "AnyGittertalk", max_tokens: int) -> Tuple[str, int]:
+    """Travel, news or joke: micro-batched with concurrent requests when DEPARTMENT_BATCH_WINDOW_MS is set"""
+    # Use the gittertalk object directly for token efficiency - don't expand back to natural language
     from gittertalk import gittertalk_to_string
     
+    # Level 2 is the baseline for departments, which maintains the token efficiency benefit
     gittertalk_str = gittertalk_to_string(gittertalk_obj, 2)
-    
-    prompt = (
-        f"You are a Comedy Assistant AI. Process this entertainment request: {gittertalk_str}\n"
-        "Interpret the compact request format and provide humor or entertainment. "
-        "Be funny and engaging."
-    )
-    response = client.chat.completions.create(
-        model=MODEL_DEPARTMENT,
-        messages=[
-            {"role": "system", "content": prompt}
-        ]
-    )
-    return response.choices[0].message.content.strip()
+    if DEPARTMENT_BATCH_WINDOW_MS > 0:
+        return await department_batcher.submit(department, (gittertalk_str, max_tokens))
+    return await complete_department(department_prompt(department, gittertalk_str), department, max_tokens)
+
+def department_cache_ttl(department: str, profile: Optional[dict]) -> float:
+    """Cache TTL for a department: configured built-ins and promoted profiles only."""
+    if department in DEPARTMENT_CACHE_TTL_SECONDS:
+        return DEPARTMENT_CACHE_TTL_SECONDS[department]
+    if profile is not None:
+        return profile["cache_ttl_seconds"]
+    return 0
 
-async def adaptive_fallback_department(gittertalk_obj: "gittertalk", department: str) -> str:
+async def travel_department(gittertalk_obj: "AnyGittertalk", max_tokens: int) -> Tuple[str, int]:
+    return await builtin_department("travel", gittertalk_obj, max_tokens)
+
+async def news_department(gittertalk_obj: "AnyGittertalk", max_tokens: int) -> Tuple[str, int]:
+    return await builtin_department("news", gittertalk_obj, max_tokens)
+
+async def joke_department(gittertalk_obj: "AnyGittertalk", max_tokens: int) -> Tuple[str, int]:
+    return await builtin_department("joke", gittertalk_obj, max_tokens)
+
+async def adaptive_fallback_department(gittertalk_obj: "AnyGittertalk", department: str, max_tokens: int) -> Tuple[str, int]:
     """
     Adaptive fallback: Creates a new department on the spot to handle the request.
     Uses compressed gittertalk format to maintain token efficiency.
@@ -161,15 +359,18 @@ async def adaptive_fallback_department(gittertalk_obj: "gittertalk", department:
         f"Interpret the compact request format as a specialist in {department}-related topics. "
         "Be helpful and professional."
     )
-    response = client.chat.completions.create(
-        model=MODEL_DEPARTMENT,
-        messages=[
-            {"role": "system", "content": prompt}
-        ]
-    )
-    return response.choices[0].message.content.strip()
+    return await complete_department(prompt, department, max_tokens)
 
-async def strict_fallback_department(requested_department: str, available_departments: list) -> str:
+async def profile_department(gittertalk_obj: "AnyGittertalk", profile: dict, max_tokens: int) -> Tuple[str, int]:
+    """
+    Promoted adaptive department: uses the profile's precompiled prompt template.
+    """
+    from gittertalk import gittertalk_to_string
+    
+    prompt = profile["prompt"].replace("{gittertalk}", gittertalk_to_string(gittertalk_obj, 2))
+    return await complete_department(prompt, profile["name"], max_tokens)
+
+async def strict_fallback_department(requested_department: str, available_departments: list) -> Tuple[str, int]:
     """
     Strict fallback: Refuses to handle requests outside of existing capabilities.
     Provides user-friendly response about what the system can actually do.
@@ -181,9 +382,9 @@ async def strict_fallback_department(requested_department: str, available_depart
         "• News and current information\n"
         "• Telling jokes and entertainment\n\n"
         "Please try rephrasing your request to match one of these areas, or consider using a different service for this type of assistance."
-    )
+    ), 0
 
-async def generic_department(gittertalk_obj: "gittertalk") -> str:
+async def generic_department(gittertalk_obj: "AnyGittertalk", max_tokens: int) -> Tuple[str, int]:
     from gittertalk import gittertalk_to_string
     
     gittertalk_str = gittertalk_to_string(gittertalk_obj, 2)
@@ -192,10 +393,4 @@ async def generic_department(gittertalk_obj: "gittertalk") -> str:
         f"You are a General Assistant AI. Process this request: {gittertalk_str}\n"
         "Interpret the compact request format and provide helpful assistance."
     )
-    response = client.chat.completions.create(
-        model=MODEL_DEPARTMENT,
-        messages=[
-            {"role": "system", "content": prompt}
-        ]
-    )
-    return response.choices[0].message.content.strip()
\ No newline at end of file
+    return await complete_department(prompt, "generic", max_tokens)
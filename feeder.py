@@ -1,8 +1,8 @@
-from openai import OpenAI
-from config import OPENAI_API_KEY, MODEL_FEEDER
-
-client = OpenAI(api_key=OPENAI_API_KEY)
+from config import get_openai_client, MODEL_FEEDER
+import metrics
+import tracing
 
+@tracing.traced("feeder")
 async def feeder_process(human_request: str) -> str:
     """
     Converts a raw human request to a structured prompt for the Interpreter.
@@ -12,11 +12,14 @@ async def feeder_process(human_request: str) -> str:
         "and output a structured summary suitable for further AI processing. "
         "Use concise English, list intent (action), object, and parameters explicitly."
     )
-    response = client.chat.completions.create(
-        model=MODEL_FEEDER,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": human_request}
-        ]
-    )
+    with tracing.span("upstream", "client", stage="feeder", model=MODEL_FEEDER) as span:
+        response = await get_openai_client().chat.completions.create(
+            model=MODEL_FEEDER,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": human_request}
+            ]
+        )
+        span.set_usage(response.usage)
+    metrics.record_usage("feeder", response.usage)
     return response.choices[0].message.content.strip()
\ No newline at end of file
@@ -0,0 +1,137 @@
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional
+
+# US states, DC and territories keyed by lowercase name
+STATES: Dict[str, str] = {
+    "alabama": "AL", "alaska": "AK", "arizona": "AZ", "arkansas": "AR",
+    "california": "CA", "colorado": "CO", "connecticut": "CT", "delaware": "DE",
+    "florida": "FL", "georgia": "GA", "hawaii": "HI", "idaho": "ID",
+    "illinois": "IL", "indiana": "IN", "iowa": "IA", "kansas": "KS",
+    "kentucky": "KY", "louisiana": "LA", "maine": "ME", "maryland": "MD",
+    "massachusetts": "MA", "michigan": "MI", "minnesota": "MN", "mississippi": "MS",
+    "missouri": "MO", "montana": "MT", "nebraska": "NE", "nevada": "NV",
+    "new hampshire": "NH", "new jersey": "NJ", "new mexico": "NM", "new york": "NY",
+    "north carolina": "NC", "north dakota": "ND", "ohio": "OH", "oklahoma": "OK",
+    "oregon": "OR", "pennsylvania": "PA", "rhode island": "RI", "south carolina": "SC",
+    "south dakota": "SD", "tennessee": "TN", "texas": "TX", "utah": "UT",
+    "vermont": "VT", "virginia": "VA", "washington": "WA", "west virginia": "WV",
+    "wisconsin": "WI", "wyoming": "WY",
+    "district of columbia": "DC", "puerto rico": "PR", "guam": "GU",
+    "us virgin islands": "VI", "virgin islands": "VI", "american samoa": "AS",
+    "northern mariana islands": "MP",
+}
+
+# Common informal and postal-style spellings of state names
+STATE_ALIASES: Dict[str, str] = {
+    "calif": "CA", "cali": "CA", "mass": "MA", "penn": "PA", "penna": "PA",
+    "wash": "WA", "fla": "FL", "tex": "TX", "mich": "MI", "minn": "MN",
+    "wis": "WI", "conn": "CT", "colo": "CO", "ariz": "AZ", "okla": "OK",
+    "d.c.": "DC", "washington dc": "DC", "washington d.c.": "DC",
+}
+
+STATE_CODES = frozenset(STATES.values())
+
+# Major cities keyed by lowercase name -> home state
+MAJOR_CITIES: Dict[str, str] = {
+    "new york": "NY", "los angeles": "CA", "chicago": "IL", "houston": "TX",
+    "phoenix": "AZ", "philadelphia": "PA", "san antonio": "TX", "san diego": "CA",
+    "dallas": "TX", "san jose": "CA", "austin": "TX", "jacksonville": "FL",
+    "fort worth": "TX", "columbus": "OH", "charlotte": "NC", "san francisco": "CA",
+    "indianapolis": "IN", "seattle": "WA", "denver": "CO", "washington": "DC",
+    "boston": "MA", "el paso": "TX", "nashville": "TN", "detroit": "MI",
+    "oklahoma city": "OK", "portland": "OR", "las vegas": "NV", "memphis": "TN",
+    "louisville": "KY", "baltimore": "MD", "milwaukee": "WI", "albuquerque": "NM",
+    "tucson": "AZ", "fresno": "CA", "sacramento": "CA", "kansas city": "MO",
+    "mesa": "AZ", "atlanta": "GA", "omaha": "NE", "colorado springs": "CO",
+    "raleigh": "NC", "miami": "FL", "long beach": "CA", "virginia beach": "VA",
+    "oakland": "CA", "minneapolis": "MN", "tulsa": "OK", "tampa": "FL",
+    "arlington": "TX", "new orleans": "LA", "wichita": "KS", "cleveland": "OH",
+    "bakersfield": "CA", "aurora": "CO", "anaheim": "CA", "honolulu": "HI",
+    "santa ana": "CA", "riverside": "CA", "corpus christi": "TX", "lexington": "KY",
+    "st. louis": "MO", "saint louis": "MO", "pittsburgh": "PA", "anchorage": "AK",
+    "cincinnati": "OH", "st. paul": "MN", "saint paul": "MN", "toledo": "OH",
+    "newark": "NJ", "greensboro": "NC", "buffalo": "NY", "plano": "TX",
+    "lincoln": "NE", "henderson": "NV", "fort wayne": "IN", "jersey city": "NJ",
+    "orlando": "FL", "st. petersburg": "FL", "chandler": "AZ", "laredo": "TX",
+    "norfolk": "VA", "durham": "NC", "madison": "WI", "lubbock": "TX",
+    "irvine": "CA", "winston-salem": "NC", "glendale": "AZ", "reno": "NV",
+    "boise": "ID", "richmond": "VA", "spokane": "WA", "des moines": "IA",
+    "salt lake city": "UT", "birmingham": "AL", "rochester": "NY", "providence": "RI",
+    "hartford": "CT", "little rock": "AR", "charleston": "SC", "savannah": "GA",
+    "akron": "OH", "dayton": "OH", "zanesville": "OH", "san juan": "PR",
+}
+
+# Nicknames, airport codes and abbreviations -> canonical city name
+CITY_ALIASES: Dict[str, str] = {
+    "nyc": "new york", "new york city": "new york", "la": "los angeles",
+    "lax": "los angeles", "sf": "san francisco", "sfo": "san francisco",
+    "philly": "philadelphia", "vegas": "las vegas", "nola": "new orleans",
+    "chi": "chicago", "chi-town": "chicago", "atl": "atlanta", "dc": "washington",
+    "d.c.": "washington", "jfk": "new york", "ord": "chicago", "dfw": "dallas",
+    "sea": "seattle", "den": "denver", "bos": "boston", "mia": "miami",
+    "abq": "albuquerque", "slc": "salt lake city", "kc": "kansas city",
+    "cbus": "columbus", "cle": "cleveland", "cincy": "cincinnati",
+}
+
+# Longest multi-word state name, bounds the suffix scan in resolve_location
+_MAX_STATE_WORDS = max(len(name.split()) for name in list(STATES) + list(STATE_ALIASES))
+
+class Location(NamedTuple):
+    city: str
+    state: Optional[str]
+
+def lookup_state(text: str) -> Optional[str]:
+    """Return the two-letter code for a state name, alias or code, or None."""
+    key = text.strip().lower()
+    code = STATES.get(key) or STATE_ALIASES.get(key)
+    if code:
+        return code
+    upper = key.upper()
+    return upper if upper in STATE_CODES else None
+
+def lookup_city(text: str) -> Optional[str]:
+    """Return the canonical lowercase name for a known city or city alias, or None."""
+    key = text.strip().lower()
+    if key in MAJOR_CITIES:
+        return key
+    return CITY_ALIASES.get(key)
+
+@lru_cache(maxsize=16384)
+def resolve_location(location: str) -> Location:
+    """
+    Split a free-form location into (city, state code).
+    Handles "City, ST", "City, State", "City State", "City ST" and alias forms.
+    Bare two-letter codes only count as a state when written in capitals, so
+    "Los Angeles CA" resolves but "Salem or" does not.
+    """
+    location = location.strip()
+
+    if "," in location:
+        city, _, state_text = location.partition(",")
+        state_text = state_text.split(",")[0].strip()
+        city = city.strip()
+        state = lookup_state(state_text) if state_text else None
+        if state_text and not state:
+            # Unknown region (e.g. a country) - keep the caller-visible code short
+            state = state_text.upper()[:2]
+        return Location(lookup_city(city) or city, state)
+
+    # Whole input is a known city or alias: never split it
+    canonical = lookup_city(location)
+    if canonical:
+        return Location(canonical, None)
+
+    words = location.split()
+    # Try the longest state-name suffix first so "West Virginia" beats "Virginia"
+    for size in range(min(_MAX_STATE_WORDS, len(words) - 1), 0, -1):
+        suffix = words[-size:]
+        suffix_text = " ".join(suffix)
+        if size == 1 and len(suffix_text) == 2:
+            state = suffix_text if suffix_text in STATE_CODES else None
+        else:
+            state = STATES.get(suffix_text.lower()) or STATE_ALIASES.get(suffix_text.lower())
+        if state:
+            city = " ".join(words[:-size])
+            return Location(lookup_city(city) or city, state)
+
+    return Location(location, None)
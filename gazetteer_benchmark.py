@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Gazetteer benchmark - correctness and throughput of stenographic_location
+against the previous substring-scan implementation
+"""
+import random
+import time
+from gazetteer import MAJOR_CITIES, STATES, resolve_location
+from gittertalk import stenographic_compress, stenographic_location
+
+def legacy_stenographic_location(location: str) -> str:
+    """The original linear-scan implementation, kept here for comparison"""
+    location = location.strip()
+    if "," in location:
+        parts = location.split(",")
+        city = parts[0].strip()
+        state = parts[1].strip() if len(parts) > 1 else ""
+    elif " " in location and any(state in location.upper() for state in ["OH", "OHIO", "NY", "CA", "TX", "FL"]):
+        parts = location.split()
+        city = " ".join(parts[:-1])
+        state = parts[-1]
+    else:
+        city = location
+        state = ""
+    legacy_map = {
+        "ohio": "OH", "new york": "NY", "california": "CA",
+        "texas": "TX", "florida": "FL", "illinois": "IL",
+        "massachusetts": "MA", "colorado": "CO", "washington": "WA"
+    }
+    city_steno = stenographic_compress(city)
+    if state:
+        return f"{city_steno}:st;{legacy_map.get(state.lower(), state.upper()[:2])}"
+    return f"{city_steno}:ct"
+
+CORRECTNESS_CASES = [
+    ("Zanesville Ohio", "zv:st;OH"),
+    ("Columbus", "cb:ct"),
+    ("Los Angeles CA", "la:st;CA"),
+    ("Chicago Heights", "chcghghts:ct"),
+    ("Kansas City Missouri", "knsscty:st;MO"),
+    ("Charleston West Virginia", "chrlstn:st;WV"),
+    ("Portland, Oregon", "prtlnd:st;OR"),
+    ("Boise Idaho", "bs:st;ID"),
+    ("San Juan Puerto Rico", "snjn:st;PR"),
+    ("Salem or", "slmr:ct"),
+    ("NYC", "ny:ct"),
+    ("Austin, tx", "at:st;TX"),
+]
+
+def test_correctness():
+    print("GAZETTEER CORRECTNESS")
+    print("=" * 60)
+    passed = 0
+    for location, expected in CORRECTNESS_CASES:
+        actual = stenographic_location(location)
+        legacy = legacy_stenographic_location(location)
+        ok = actual == expected
+        passed += ok
+        print(f"{'✓' if ok else '✗'} {location!r:32} -> {actual:18} (legacy: {legacy})")
+    print(f"\n{passed}/{len(CORRECTNESS_CASES)} correct")
+    return passed == len(CORRECTNESS_CASES)
+
+def build_locations(count: int, seed: int = 7) -> list:
+    """Generate a mixed workload of bare cities, "City ST" and "City, State" forms"""
+    rng = random.Random(seed)
+    cities = [name.title() for name in MAJOR_CITIES]
+    states = list(STATES.items())
+    locations = []
+    for _ in range(count):
+        city = rng.choice(cities)
+        name, code = rng.choice(states)
+        form = rng.randrange(4)
+        if form == 0:
+            locations.append(city)
+        elif form == 1:
+            locations.append(f"{city} {code}")
+        elif form == 2:
+            locations.append(f"{city}, {name.title()}")
+        else:
+            locations.append(f"{city} {name.title()}")
+    return locations
+
+def benchmark(fn, locations: list) -> float:
+    start = time.perf_counter()
+    for location in locations:
+        fn(location)
+    return time.perf_counter() - start
+
+def test_throughput(count: int = 200_000):
+    print("\nGAZETTEER THROUGHPUT")
+    print("=" * 60)
+    locations = build_locations(count)
+
+    resolve_location.cache_clear()
+    stenographic_location.cache_clear()
+    legacy = benchmark(legacy_stenographic_location, locations)
+    cold = benchmark(stenographic_location, locations)
+    warm = benchmark(stenographic_location, locations)
+    info = stenographic_location.cache_info()
+
+    for label, elapsed in [("legacy scan", legacy), ("gazetteer (cold)", cold), ("gazetteer (memoized)", warm)]:
+        print(f"{label:22} {count / elapsed:>12,.0f} lookups/s  ({elapsed * 1000:.1f} ms)")
+    print(f"cache: {info.hits:,} hits, {info.misses:,} misses, {info.currsize:,} entries")
+
+if __name__ == "__main__":
+    test_correctness()
+    test_throughput()
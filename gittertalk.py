@@ -1,12 +1,69 @@
-from typing import Dict, Any, Optional
+from functools import lru_cache
+from typing import Dict, Any, NamedTuple, Optional, Tuple, Union
 from pydantic import BaseModel, Field
+from gazetteer import lookup_state, resolve_location
 
 class gittertalk(BaseModel):
     act: str
     obj: str
     params: Optional[Dict[str, str]] = Field(default_factory=dict)
 
-def gittertalk_to_string(gt: gittertalk, verbose_level: int = 2) -> str:
+class CompactGittertalk(NamedTuple):
+    """
+    Internal hot-path gittertalk: tuple-backed, immutable and hashable, so it can be
+    used directly as a cache key. params is a tuple of (key, value) pairs.
+    The pydantic gittertalk model is kept for the API boundary.
+    """
+    act: str
+    obj: str
+    params: Tuple[Tuple[str, str], ...] = ()
+
+    @classmethod
+    def from_model(cls, gt: gittertalk) -> "CompactGittertalk":
+        return cls(gt.act, gt.obj, tuple((gt.params or {}).items()))
+
+    def to_model(self) -> gittertalk:
+        return gittertalk(act=self.act, obj=self.obj, params=dict(self.params))
+
+# Location abbreviation map for common places (level 2)
+LOCATION_ABBREVIATIONS = {
+    "Zanesville": "Zan", "Columbus": "Col", "Cleveland": "Clv",
+    "Cincinnati": "Cin", "New York": "NYC", "Los Angeles": "LAX", 
+    "Chicago": "Chi", "Boston": "Bos", "Austin": "Aus",
+    "Denver": "Den", "Miami": "Mia", "Seattle": "Sea"
+}
+
+# Special cases for common locations and values (level 4)
+STENO_SPECIAL_CASES = {
+    "zanesville": "zv", "columbus": "cb", "cleveland": "cv", 
+    "cincinnati": "cn", "new york": "ny", "los angeles": "la",
+    "chicago": "cg", "boston": "bt", "austin": "at", "denver": "dv",
+    "miami": "mi", "seattle": "st", "tomorrow": "tm", "today": "td",
+    "morning": "mr", "afternoon": "af", "evening": "ev", 
+    "business": "bs", "economy": "ec", "first": "fs"
+}
+
+# Either representation is accepted by the formatting and department helpers
+AnyGittertalk = Union[gittertalk, CompactGittertalk]
+
+def gittertalk_params(gt: AnyGittertalk) -> Dict[str, str]:
+    """Params of either representation as a dict"""
+    if isinstance(gt.params, tuple):
+        return dict(gt.params)
+    return gt.params or {}
+
+def apply_delta(gt: AnyGittertalk, delta: Dict[str, Any]) -> CompactGittertalk:
+    """
+    Merge an interpreter delta onto a gittertalk object:
+    {"a": act, "o": obj, "set": {param: value}, "del": [param]} - every key optional.
+    """
+    params = dict(gittertalk_params(gt))
+    for key in delta.get("del", []):
+        params.pop(key, None)
+    params.update(delta.get("set", {}))
+    return CompactGittertalk(delta.get("a", gt.act), delta.get("o", gt.obj), tuple(params.items()))
+
+def gittertalk_to_string(gt: AnyGittertalk, verbose_level: int = 2) -> str:
     """
     Converts gittertalk object to a string representation.
     Output format depends on verbose_level:
@@ -16,7 +73,7 @@ def gittertalk_to_string(gt: gittertalk, verbose_level: int = 2) -> str:
     """
     if verbose_level == 1:
         # Level 1: Full format with no abbreviations
-        params = gt.params or {}
+        params = gittertalk_params(gt)
         parts = [f"act:{gt.act}", f"obj:{gt.obj}"]
         
         for key, value in params.items():
@@ -38,27 +95,22 @@ def gittertalk_to_string(gt: gittertalk, verbose_level: int = 2) -> str:
         obj_map = {
             "directions": "dir", "booking": "bkg", "Flight": "Flt", 
             "Hotel": "Htl", "Car": "Car", "News": "Nws", "Joke": "Jke",
-            "Route": "Rte", "information": "inf", "entertainment": "ent"
-        }
-        
-        # Location abbreviation map for common places
-        location_map = {
-            "Zanesville": "Zan", "Columbus": "Col", "Cleveland": "Clv",
-            "Cincinnati": "Cin", "New York": "NYC", "Los Angeles": "LAX", 
-            "Chicago": "Chi", "Boston": "Bos", "Austin": "Aus",
-            "Denver": "Den", "Miami": "Mia", "Seattle": "Sea"
+            "Route": "Rte", "information": "inf", "entertainment": "ent",
+            # Lowercase forms produced by canonicalization
+            "flight": "Flt", "hotel": "Htl", "car": "Car", "news": "Nws",
+            "joke": "Jke", "route": "Rte"
         }
         
         act = act_map.get(gt.act, gt.act)
         obj = obj_map.get(gt.obj, gt.obj)
         
-        params = gt.params or {}
+        params = gittertalk_params(gt)
         parts = [f"act:{act}", f"obj:{obj}"]
         
         for key, value in params.items():
             # Abbreviate common location names
-            if key in ["from", "to", "location"] and value in location_map:
-                value = location_map[value]
+            if key in ["from", "to", "location"] and value in LOCATION_ABBREVIATIONS:
+                value = LOCATION_ABBREVIATIONS[value]
             parts.append(f"{key}:{value}")
             
         return ";".join(parts)
@@ -71,7 +123,7 @@ def gittertalk_to_string(gt: gittertalk, verbose_level: int = 2) -> str:
         # Fallback to level 2 for any invalid level
         return gittertalk_to_string(gt, 2)
 
-def create_stenographic_format(gt: gittertalk) -> str:
+def create_stenographic_format(gt: AnyGittertalk) -> str:
     """
     Create stenographic compression with context markers:
     - Context markers: ct=city, st=state, ap=airport, ht=hotel, tm=time
@@ -90,10 +142,13 @@ def create_stenographic_format(gt: gittertalk) -> str:
     object_steno = {
         "directions": "dr", "booking": "bk", "Flight": "fl", 
         "Hotel": "ht", "Car": "cr", "News": "nw", "Joke": "jk",
-        "Route": "rt", "information": "if", "entertainment": "et"
+        "Route": "rt", "information": "if", "entertainment": "et",
+        # Lowercase forms produced by canonicalization
+        "flight": "fl", "hotel": "ht", "car": "cr", "news": "nw",
+        "joke": "jk", "route": "rt"
     }
     
-    params = gt.params or {}
+    params = gittertalk_params(gt)
     parts = []
     
     # Add action with context
@@ -138,18 +193,8 @@ def stenographic_compress(text: str) -> str:
         
     text = text.lower().strip()
     
-    # Special cases for common locations
-    special_cases = {
-        "zanesville": "zv", "columbus": "cb", "cleveland": "cv", 
-        "cincinnati": "cn", "new york": "ny", "los angeles": "la",
-        "chicago": "cg", "boston": "bt", "austin": "at", "denver": "dv",
-        "miami": "mi", "seattle": "st", "tomorrow": "tm", "today": "td",
-        "morning": "mr", "afternoon": "af", "evening": "ev", 
-        "business": "bs", "economy": "ec", "first": "fs"
-    }
-    
-    if text in special_cases:
-        return special_cases[text]
+    if text in STENO_SPECIAL_CASES:
+        return STENO_SPECIAL_CASES[text]
     
     # General stenographic compression
     # Remove vowels except at start, keep important consonants
@@ -173,41 +218,20 @@ def stenographic_compress(text: str) -> str:
         
     return result
 
+@lru_cache(maxsize=16384)
 def stenographic_location(location: str) -> str:
     """
     Convert location to stenographic format with state context
     Zanesville Ohio → zv:st;OH, Columbus Ohio → cb:st;OH
     """
-    location = location.strip()
-    
-    # Handle "City, State" or "City State" patterns
-    if "," in location:
-        parts = location.split(",")
-        city = parts[0].strip()
-        state = parts[1].strip() if len(parts) > 1 else ""
-    elif " " in location and any(state in location.upper() for state in ["OH", "OHIO", "NY", "CA", "TX", "FL"]):
-        parts = location.split()
-        city = " ".join(parts[:-1])
-        state = parts[-1]
-    else:
-        city = location
-        state = ""
-    
+    city, state = resolve_location(location)
     city_steno = stenographic_compress(city)
     
     if state:
-        state_abbrev = get_state_abbreviation(state)
-        return f"{city_steno}:st;{state_abbrev}"
+        return f"{city_steno}:st;{state}"
     else:
         return f"{city_steno}:ct"
 
 def get_state_abbreviation(state: str) -> str:
     """Get standard state abbreviation"""
-    state_map = {
-        "ohio": "OH", "new york": "NY", "california": "CA", 
-        "texas": "TX", "florida": "FL", "illinois": "IL",
-        "massachusetts": "MA", "colorado": "CO", "washington": "WA"
-    }
-    
-    state_lower = state.lower()
-    return state_map.get(state_lower, state.upper()[:2])
\ No newline at end of file
+    return lookup_state(state) or state.strip().upper()[:2]
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark - construction time and memory of the pydantic gittertalk model
+against CompactGittertalk at high object counts
+"""
+import sys
+import time
+import tracemalloc
+from gittertalk import CompactGittertalk, gittertalk
+
+PARAMS = {"from": "Columbus", "to": "Denver", "when": "+1", "class": "economy"}
+PARAM_PAIRS = tuple(PARAMS.items())
+
+def build_model(count: int) -> list:
+    return [gittertalk(act="flight", obj="Flight", params=PARAMS) for _ in range(count)]
+
+def build_compact(count: int) -> list:
+    return [CompactGittertalk("flight", "Flight", PARAM_PAIRS) for _ in range(count)]
+
+def build_compact_from_dict(count: int) -> list:
+    # What the parsers do: params are collected into a dict first, then frozen
+    return [CompactGittertalk("flight", "Flight", tuple(PARAMS.items())) for _ in range(count)]
+
+def measure(label: str, builder, count: int) -> None:
+    start = time.perf_counter()
+    builder(count)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    objects = builder(count)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+
+    print(f"{label:30} {elapsed * 1000:9.1f} ms  {elapsed / count * 1e9:7.0f} ns/obj  "
+          f"{current / count:7.0f} B/obj")
+
+def test_conversion(count: int) -> None:
+    model = gittertalk(act="flight", obj="Flight", params=PARAMS)
+    compact = CompactGittertalk.from_model(model)
+    assert compact.to_model() == model
+
+    for label, fn in [("model -> compact", lambda: CompactGittertalk.from_model(model)),
+                      ("compact -> model", compact.to_model),
+                      ("hash(compact)", lambda: hash(compact))]:
+        start = time.perf_counter()
+        for _ in range(count):
+            fn()
+        elapsed = time.perf_counter() - start
+        print(f"{label:30} {elapsed / count * 1e9:7.0f} ns/op")
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    print(f"GITTERTALK CONSTRUCTION ({count:,} objects)")
+    print("=" * 80)
+    measure("pydantic gittertalk", build_model, count)
+    measure("CompactGittertalk", build_compact, count)
+    measure("CompactGittertalk (from dict)", build_compact_from_dict, count)
+    print()
+    test_conversion(min(count, 100_000))
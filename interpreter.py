@@ -1,19 +1,41 @@
-from openai import OpenAI
-from config import OPENAI_API_KEY, MODEL_INTERPRETER
-from typing import TYPE_CHECKING, Tuple
+import json
+from config import get_openai_client, MODEL_INTERPRETER, INTERPRETER_OUTPUT_MODE, INTERPRETER_MAX_TOKENS, MAX_INTENTS
+from typing import TYPE_CHECKING, List, Optional, Tuple
+from profiles import normalize_department
+import metrics
+import tracing
 
 if TYPE_CHECKING:
-    from gittertalk import gittertalk
+    from gittertalk import AnyGittertalk, CompactGittertalk
 
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-async def interpreter_process(structured_prompt: str, verbose_level: int = 2) -> Tuple["gittertalk", str]:
+async def interpreter_process(structured_prompt: str, verbose_level: int = 2) -> Tuple["CompactGittertalk", str]:
     """
     Converts structured prompt to gittertalk and determines department.
     verbose_level: 1=full format, 2=abbreviated, 4=stenographic
+    Only the first intent is returned; see interpreter_process_intents.
     """
-    from gittertalk import gittertalk  # Import here to avoid circular import
-    
+    intents = await interpreter_process_intents(structured_prompt, verbose_level)
+    return intents[0]
+
+@tracing.traced("interpreter")
+async def interpreter_process_intents(structured_prompt: str, verbose_level: int = 2) -> List[Tuple["CompactGittertalk", str]]:
+    """
+    Converts structured prompt to one (gittertalk, department) pair per independent
+    request it contains, in order, capped at MAX_INTENTS.
+    Output mode is chosen by INTERPRETER_OUTPUT_MODE ("json" or "text").
+    """
+    tracing.current_span().set(mode=INTERPRETER_OUTPUT_MODE, verbose_level=verbose_level)
+    if INTERPRETER_OUTPUT_MODE == "json":
+        intents = await interpreter_process_structured(structured_prompt)
+    else:
+        intents = await interpreter_process_text(structured_prompt)
+    if len(intents) > 1:
+        metrics.increment("interpreter.multi_intent")
+    tracing.current_span().set(intents=len(intents))
+    return [(gittertalk_obj, normalize_department(department)) for gittertalk_obj, department in intents[:MAX_INTENTS]]
+
+async def interpreter_process_text(structured_prompt: str) -> List[Tuple["CompactGittertalk", str]]:
+    """Legacy free-text interpreter: gittertalk:/DEPARTMENT: line pairs."""
     # Use ONE consistent system prompt that always outputs the same format
     system_prompt = (
         "You are the Interpreter AI. Convert the structured prompt to gittertalk format using: "
@@ -25,35 +47,257 @@ async def interpreter_process(structured_prompt: str, verbose_level: int = 2) ->
         "After the gittertalk, suggest which Department should handle the request. "
         "Available departments: 'travel', 'news', 'joke'. "
         "If the request doesn't clearly fit, suggest the most relevant one or use 'other'. "
+        "If it contains several independent requests, repeat both lines once per request, in order. "
         "\nRespond as:\ngittertalk:<gittertalk>\nDEPARTMENT:<department>"
     )
-    response = client.chat.completions.create(
-        model=MODEL_INTERPRETER,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": structured_prompt}
-        ]
-    )
+    with tracing.span("upstream", "client", stage="interpreter", model=MODEL_INTERPRETER) as span:
+        response = await get_openai_client().chat.completions.create(
+            model=MODEL_INTERPRETER,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": structured_prompt}
+            ]
+        )
+        span.set_usage(response.usage)
+    metrics.record_usage("interpreter", response.usage)
     content = response.choices[0].message.content.strip()
+    with tracing.span("interpreter.parse", format="text"):
+        return parse_text_response(content)
+
+async def interpreter_process_structured(structured_prompt: str) -> List[Tuple["CompactGittertalk", str]]:
+    """
+    Schema-constrained interpreter: asks for a compact JSON object and validates
+    it in one pass. Malformed replies are counted, repaired where possible, and
+    otherwise re-asked once in text mode.
+    """
+    system_prompt = (
+        "Convert the request to JSON only, no prose: "
+        '{"a":<action>,"o":<object>,"p":{<param>:<value>},"d":<department>}. '
+        'For several independent requests reply {"i":[<object>,...]} in order. '
+        "Actions: route, flight, hotel, car, news, joke, book, search, find, get. "
+        "Objects: directions, booking, Flight, Hotel, Car, News, Joke, information. "
+        "Params: from, to, when, class, type, time, location. "
+        "Departments: travel, news, joke, or one short lowercase topic word."
+    )
+    with tracing.span("upstream", "client", stage="interpreter", model=MODEL_INTERPRETER) as span:
+        response = await get_openai_client().chat.completions.create(
+            model=MODEL_INTERPRETER,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": structured_prompt}
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=INTERPRETER_MAX_TOKENS
+        )
+        span.set_usage(response.usage)
+    metrics.record_usage("interpreter", response.usage)
+    content = (response.choices[0].message.content or "").strip()
+    
+    with tracing.span("interpreter.parse", format="json"):
+        parsed = parse_structured_response(content)
+    if parsed is not None:
+        metrics.increment("interpreter.structured.ok")
+        return parsed
+    
+    metrics.increment("interpreter.structured.malformed")
+    print(f"Warning: Malformed structured interpreter output: {content}")
+    with tracing.span("interpreter.parse", format="json_repair"):
+        repaired = repair_structured_response(content)
+    if repaired is not None:
+        metrics.increment("interpreter.structured.repaired")
+        return repaired
+    
+    # Nothing usable in the reply: ask once more in text mode rather than
+    # sending an unknown intent to the generic department
+    metrics.increment("interpreter.structured.reask")
+    return await interpreter_process_text(structured_prompt)
+
+def repair_structured_response(content: str) -> Optional[List[Tuple["CompactGittertalk", str]]]:
+    """
+    Recover a structured reply wrapped in prose or code fences, or cut off by the
+    token limit: parses from the first "{" and, if that fails, keeps the complete
+    intents of a truncated {"i":[...]} list. Returns None if nothing validates.
+    """
+    start, end = content.find("{"), content.rfind("}")
+    if start == -1:
+        return None
+    if end > start:
+        parsed = parse_structured_response(content[start:end + 1])
+        if parsed is not None:
+            return parsed
+    
+    # Truncated multi-intent reply: keep the items that closed before the cut
+    depth, in_string, escaped, last_item_end = 0, False, False, None
+    for index in range(start, len(content)):
+        char = content[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 2 and char == "}":
+                last_item_end = index
+    if last_item_end is None:
+        return None
+    return parse_structured_response(content[start:last_item_end + 1] + "]}")
+
+def parse_structured_response(content: str) -> Optional[List[Tuple["CompactGittertalk", str]]]:
+    """
+    Validate a compact interpreter reply {"a","o","p","d"} (or {"i":[...]} for
+    several intents) into a list of (gittertalk, department) pairs.
+    Returns None if the reply does not match the schema.
+    """
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    
+    items = data["i"] if "i" in data else [data]
+    if not isinstance(items, list) or not items:
+        return None
+    intents = []
+    for item in items:
+        parsed = parse_structured_item(item)
+        if parsed is None:
+            return None
+        intents.append(parsed)
+    return intents
+
+def parse_structured_item(data) -> Optional[Tuple["CompactGittertalk", str]]:
+    """Validate one {"a","o","p","d"} object; returns None if it does not match the schema."""
+    from gittertalk import CompactGittertalk  # Import here to avoid circular import
+    
+    if not isinstance(data, dict):
+        return None
+    
+    act, obj, department = data.get("a"), data.get("o"), data.get("d")
+    params = data.get("p") or {}
+    if not (isinstance(act, str) and act and isinstance(obj, str) and obj):
+        return None
+    if not isinstance(department, str) or not department.strip():
+        return None
+    if not isinstance(params, dict):
+        return None
+    
+    # Scalar values are accepted and stringified; nested values are not
+    clean_params = {}
+    for key, value in params.items():
+        if isinstance(value, (dict, list)) or value is None:
+            return None
+        clean_params[str(key)] = str(value)
+    
+    return CompactGittertalk(act, obj, tuple(clean_params.items())), department.strip().lower()
+
+@tracing.traced("interpreter.delta")
+async def interpreter_delta(follow_up: str, previous: "AnyGittertalk", department: str) -> Optional[Tuple["CompactGittertalk", str, dict]]:
+    """
+    Session follow-up: send only the stored gittertalk and the raw follow-up text,
+    and ask for a parameter delta instead of a full re-interpretation.
+    Returns (merged gittertalk, department, delta), or None if the reply is malformed.
+    """
+    from gittertalk import apply_delta, gittertalk_params  # Import here to avoid circular import
+    
+    state = json.dumps({"a": previous.act, "o": previous.obj, "p": gittertalk_params(previous), "d": department},
+                       separators=(",", ":"))
+    system_prompt = (
+        f"State:{state}\nUpdate the state for the user's follow-up. Reply JSON only with changes: "
+        '{"a"?:<action>,"o"?:<object>,"d"?:<department>,"set"?:{<param>:<value>},"del"?:[<param>]}. '
+        "Reply {} if nothing changes."
+    )
+    with tracing.span("upstream", "client", stage="interpreter.delta", model=MODEL_INTERPRETER) as span:
+        response = await get_openai_client().chat.completions.create(
+            model=MODEL_INTERPRETER,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": follow_up}
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=INTERPRETER_MAX_TOKENS
+        )
+        span.set_usage(response.usage)
+    metrics.record_usage("interpreter", response.usage)
+    content = (response.choices[0].message.content or "").strip()
+    
+    delta = parse_delta_response(content)
+    if delta is None:
+        metrics.increment("interpreter.delta.malformed")
+        print(f"Warning: Malformed interpreter delta: {content}")
+        return None
+    
+    metrics.increment("interpreter.delta.ok")
+    new_department = normalize_department(delta.pop("d", department))
+    return apply_delta(previous, delta), new_department, delta
+
+def parse_delta_response(content: str) -> Optional[dict]:
+    """Validate a delta reply {"a"?,"o"?,"d"?,"set"?,"del"?}; returns None if malformed."""
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    
+    delta = {}
+    for key in ("a", "o", "d"):
+        if key in data:
+            if not isinstance(data[key], str) or not data[key].strip():
+                return None
+            delta[key] = data[key].strip().lower() if key == "d" else data[key].strip()
+    
+    changes = data.get("set", {})
+    removed = data.get("del", [])
+    if not isinstance(changes, dict) or not isinstance(removed, list):
+        return None
+    if any(isinstance(v, (dict, list)) or v is None for v in changes.values()):
+        return None
+    if changes:
+        delta["set"] = {str(k): str(v) for k, v in changes.items()}
+    if removed:
+        delta["del"] = [str(k) for k in removed]
+    return delta
+
+def parse_text_response(content: str) -> List[Tuple["CompactGittertalk", str]]:
+    """
+    Parse a free-text interpreter reply (gittertalk:... / DEPARTMENT:... lines).
+    Several complete line pairs become several intents; anything else yields one.
+    """
     lines = content.splitlines()
     
     # Find gittertalk line with better error handling
-    gt_line = None
-    dept_line = None
+    gt_lines = []
+    dept_lines = []
     
     for line in lines:
         line = line.strip()
         if line.lower().startswith("gittertalk:"):
-            gt_line = line
+            gt_lines.append(line)
         elif line.upper().startswith("DEPARTMENT:"):
-            dept_line = line
+            dept_lines.append(line)
         elif "act:" in line and "obj:" in line:
             # This looks like a gittertalk format without the "gittertalk:" prefix
-            gt_line = "gittertalk:" + line
+            gt_lines.append("gittertalk:" + line)
+    
+    if len(gt_lines) > 1 and len(gt_lines) == len(dept_lines):
+        return [parse_text_pair(gt, dept) for gt, dept in zip(gt_lines, dept_lines)]
+    
+    gt_line = gt_lines[-1] if gt_lines else None
+    dept_line = dept_lines[-1] if dept_lines else None
     
     # Fallback if expected format not found
     if not gt_line or not dept_line:
         print(f"Warning: Expected format not found in AI response: {content}")
+        metrics.increment("interpreter.text.fallback")
+        tracing.current_span().set(fallback=True)
         # Try to extract from the raw content or use defaults
         if "gittertalk:" in content.lower():
             gt_line = content[content.lower().find("gittertalk:"):]
@@ -66,6 +310,7 @@ async def interpreter_process(structured_prompt: str, verbose_level: int = 2) ->
                     break
         else:
             gt_line = "gittertalk:act:unknown;obj:unknown"
+            metrics.increment("interpreter.unknown")
             
         if "department:" in content.lower():
             dept_line = content[content.lower().find("department:"):]
@@ -73,6 +318,12 @@ async def interpreter_process(structured_prompt: str, verbose_level: int = 2) ->
         else:
             dept_line = "DEPARTMENT:generic"
     
+    return [parse_text_pair(gt_line, dept_line)]
+
+def parse_text_pair(gt_line: str, dept_line: str) -> Tuple["CompactGittertalk", str]:
+    """Turn one gittertalk:/DEPARTMENT: line pair into (gittertalk, department)."""
+    from gittertalk import CompactGittertalk  # Import here to avoid circular import
+    
     # Extract gittertalk and department
     gittertalk_str = gt_line[gt_line.find(":")+1:].strip()
     department = dept_line[dept_line.find(":")+1:].strip().lower()
@@ -81,15 +332,14 @@ async def interpreter_process(structured_prompt: str, verbose_level: int = 2) ->
     try:
         gittertalk_parsed = parse_consistent_gittertalk(gittertalk_str)
     except Exception as e:
-        from gittertalk import gittertalk  # Import here to avoid circular import
         print(f"Error parsing gittertalk: {e}")
-        gittertalk_parsed = gittertalk(act="unknown", obj="unknown", params={})
+        gittertalk_parsed = CompactGittertalk("unknown", "unknown")
     
     return gittertalk_parsed, department
 
-def parse_consistent_gittertalk(gittertalk_str: str):
+def parse_consistent_gittertalk(gittertalk_str: str) -> "CompactGittertalk":
     """Parse consistent gittertalk format: act:action;obj:object;param:value;param:value"""
-    from gittertalk import gittertalk  # Import here to avoid circular import
+    from gittertalk import CompactGittertalk  # Import here to avoid circular import
     
     parts = gittertalk_str.split(";")
     if len(parts) >= 2:
@@ -110,4 +360,4 @@ def parse_consistent_gittertalk(gittertalk_str: str):
         obj = "unknown"
         params = {}
         
-    return gittertalk(act=act, obj=obj, params=params)
\ No newline at end of file
+    return CompactGittertalk(act, obj, tuple(params.items()))
\ No newline at end of file
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import time
+import urllib.request
+import uuid
+from collections import deque
+from threading import Lock
+from typing import Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+from config import (
+    JOBS_WORKERS, JOBS_MAX_QUEUE, JOBS_MAX_ENTRIES, JOBS_RESULT_TTL_SECONDS,
+    JOBS_CALLBACK_TIMEOUT
+)
+import metrics
+
+# Callbacks may only target this host; jobs never call out to arbitrary URLs
+_LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+class JobStore:
+    """
+    Bounded job state keyed by job id.
+    Finished jobs expire after ttl_seconds; when full, the oldest finished job is
+    evicted, and a store holding only unfinished jobs refuses new ones.
+    """
+
+    def __init__(self, max_entries: int = JOBS_MAX_ENTRIES, ttl_seconds: float = JOBS_RESULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, dict] = {}
+        # Finished job ids in finish order, so also in expiry order (one TTL for all)
+        self._finished: deque = deque()
+        self._lock = Lock()
+
+    def _expire(self) -> None:
+        now = time.time()
+        while self._finished and self._jobs[self._finished[0]]["expires_at"] < now:
+            del self._jobs[self._finished.popleft()]
+
+    def create(self, callback_url: Optional[str]) -> Optional[dict]:
+        with self._lock:
+            self._expire()
+            if len(self._jobs) >= self.max_entries:
+                if not self._finished:
+                    return None
+                del self._jobs[self._finished.popleft()]
+            job = {
+                "id": uuid.uuid4().hex,
+                "status": "queued",
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "callback_url": callback_url,
+                "result": None,
+                "error": None,
+                "expires_at": None,
+            }
+            self._jobs[job["id"]] = job
+            return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id: str, **fields) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.update(fields)
+            if fields.get("status") in ("done", "failed") and job["expires_at"] is None:
+                job["expires_at"] = time.time() + self.ttl_seconds
+                self._finished.append(job_id)
+            return dict(job)
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+def is_local_url(url: str) -> bool:
+    parsed = urlparse(url)
+    return parsed.scheme in ("http", "https") and parsed.hostname in _LOCAL_HOSTS
+
+def public_view(job: dict) -> dict:
+    """Job fields returned by GET /jobs/{id} and sent to callbacks"""
+    return {key: job[key] for key in ("id", "status", "created_at", "started_at", "finished_at", "result", "error")}
+
+def _post_json(url: str, payload: dict) -> None:
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}, method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=JOBS_CALLBACK_TIMEOUT) as response:
+        response.read()
+
+class JobQueue:
+    """
+    Bounded queue of pending jobs drained by a pool of background workers.
+    handler(request) runs one job and returns its result; workers start on the
+    first submit so the pool always lives on the serving event loop.
+    """
+
+    def __init__(self, store: JobStore, workers: int = JOBS_WORKERS, max_queue: int = JOBS_MAX_QUEUE):
+        self.store = store
+        self.workers = workers
+        self.max_queue = max_queue
+        self.handler: Optional[Callable[[object], Awaitable[dict]]] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.running = 0
+
+    def _ensure_workers(self) -> None:
+        if self._tasks and not all(task.done() for task in self._tasks):
+            return
+        # Jobs already queued stay queued for the new workers
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, request, callback_url: Optional[str] = None) -> Optional[dict]:
+        """Enqueue a request; returns the new job, or None when the queue or store is full."""
+        self._ensure_workers()
+        if self._queue.full():
+            metrics.increment("jobs.rejected")
+            return None
+        job = self.store.create(callback_url)
+        if job is None:
+            metrics.increment("jobs.rejected")
+            return None
+        self._queue.put_nowait((job["id"], request))
+        metrics.increment("jobs.submitted")
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            job_id, request = await self._queue.get()
+            try:
+                await self._run(job_id, request)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str, request) -> None:
+        started = time.time()
+        job = self.store.update(job_id, status="running", started_at=started)
+        if job is None:
+            return
+        metrics.observe("jobs.queue_delay_ms", (started - job["created_at"]) * 1000)
+        self.running += 1
+        try:
+            result = await self.handler(request)
+            job = self.store.update(job_id, status="done", result=result, finished_at=time.time())
+            metrics.increment("jobs.completed")
+        except Exception as e:
+            job = self.store.update(job_id, status="failed", error=str(e), finished_at=time.time())
+            metrics.increment("jobs.failed")
+        finally:
+            self.running -= 1
+        if job and job["callback_url"]:
+            await self._callback(job)
+
+    async def _callback(self, job: dict) -> None:
+        try:
+            await asyncio.to_thread(_post_json, job["callback_url"], public_view(job))
+            metrics.increment("jobs.callback.sent")
+        except Exception as e:
+            metrics.increment("jobs.callback.failed")
+            print(f"Warning: Job {job['id']} callback to {job['callback_url']} failed: {e}")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def state(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": self.running,
+            "stored": len(self.store),
+        }
+
+jobs = JobQueue(JobStore())
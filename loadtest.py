@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Load generator for main.app against the local upstream stand-in.
+
+Drives /process in-process (ASGI) or through a local uvicorn worker, open loop
+at a Poisson arrival rate or closed loop at a fixed concurrency, and reports
+throughput, p50/p95/p99 latency and error rates overall and per pipeline
+stage. Stage figures come from the OTLP traces the app exports (TRACE_EXPORT_PATH
+points at a temporary file for the run), so failed requests count too.
+Department profiles and router files also live in that temporary directory.
+The caches stay on unless --no-cache is given; the cache settings in effect are
+saved with the results, which are JSON for comparison between runs.
+
+    python loadtest.py --rate 50 --requests 500 --latency 0.05
+    python loadtest.py --concurrency 32 --duration 30 --mode uvicorn --output run.json
+    python loadtest.py --mix requests_mix.jsonl --compare baseline.json
+    python loadtest.py --no-cache                   # every request runs the full pipeline
+
+Mix files hold one /process body per line; an optional "weight" field sets how
+often it is sampled.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+# Default request mix: all three departments, an adaptive one and a strict rejection,
+# across verbose levels and fallback modes
+DEFAULT_MIX = [
+    {"request": "Book a flight from Columbus to Denver tomorrow", "verbose": 2, "weight": 3},
+    {"request": "Find me a hotel in NYC for the weekend", "verbose": 4, "weight": 2},
+    {"request": "Directions from Zanesville to Columbus", "verbose": 1, "weight": 1},
+    {"request": "What's happening in the news today?", "verbose": 2, "weight": 2},
+    {"request": "Tell me a funny joke", "verbose": 4, "fallback_mode": "strict", "weight": 2},
+    {"request": "What's the weather forecast for Seattle?", "verbose": 2, "weight": 1},
+    {"request": "Give me a pasta recipe", "verbose": 2, "fallback_mode": "strict", "weight": 1},
+]
+
+# Settings that decide how much of the pipeline a request skips; saved with the results
+CACHE_SETTINGS = ["NEARDUP_ENABLED", "NEARDUP_THRESHOLD", "NEARDUP_REUSE_RESPONSE", "DEPARTMENT_CACHE_TTL_SECONDS",
+                  "PROFILE_CACHE_TTL_SECONDS", "CANONICALIZE_GITTERTALK", "DEPARTMENT_BATCH_WINDOW_MS"]
+
+# Trace spans reported as pipeline stages
+STAGES = ["pipeline", "feeder", "interpreter", "department", "upstream", "cache.lookup"]
+
+def load_mix(path: Optional[str]) -> List[dict]:
+    if not path:
+        return DEFAULT_MIX
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def stage_stats(trace_path: str) -> Dict[str, dict]:
+    """Duration summary and error rate per stage from exported OTLP/JSON traces"""
+    durations: Dict[str, List[float]] = defaultdict(list)
+    errors: Counter = Counter()
+    with open(trace_path) as f:
+        for line in f:
+            for resource in json.loads(line)["resourceSpans"]:
+                for scope in resource["scopeSpans"]:
+                    for span in scope["spans"]:
+                        name = span["name"]
+                        durations[name].append((int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6)
+                        errors[name] += span["status"]["code"] == 2
+    stages = {}
+    for stage in STAGES:
+        values = durations.get(stage, [])
+        stages[stage] = dict(summarize(values), errors=errors[stage],
+                             error_rate=round(errors[stage] / len(values), 4) if values else 0.0)
+    return stages
+
+def summarize(values: List[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(max(values), 3),
+    }
+
+async def http_request(port: int, method: str, path: str, payload=None):
+    """Minimal HTTP/1.1 client for the local uvicorn worker. Returns (status, json body)."""
+    body = json.dumps(payload).encode() if payload is not None else b""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    head, _, content = raw.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    if b"transfer-encoding: chunked" in head.lower():
+        decoded, rest = b"", content
+        while rest:
+            size_line, _, rest = rest.partition(b"\r\n")
+            size = int(size_line, 16)
+            if size == 0:
+                break
+            decoded, rest = decoded + rest[:size], rest[size + 2:]
+        content = decoded
+    try:
+        return status, json.loads(content) if content else None
+    except ValueError:
+        return status, None  # plain-text error page
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.mix = load_mix(args.mix)
+        self.weights = [item.get("weight", 1) for item in self.mix]
+        self.rng = random.Random(args.seed)
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.exceptions: Counter = Counter()
+        self.cached = 0
+        self.degraded = 0
+
+    def sample(self) -> dict:
+        item = dict(self.rng.choices(self.mix, self.weights)[0])
+        item.pop("weight", None)
+        return item
+
+    async def send(self, payload: dict) -> None:
+        started = time.perf_counter()
+        try:
+            status, body = await self.request("POST", "/process", payload)
+        except Exception as e:
+            self.exceptions[type(e).__name__] += 1
+            return
+        self.latencies.append((time.perf_counter() - started) * 1000)
+        self.statuses[status] += 1
+        if status != 200 or not isinstance(body, dict):
+            return
+        if body.get("usage", {}).get("cached"):
+            self.cached += 1
+        if body.get("degraded"):
+            self.degraded += 1
+
+    async def closed_loop(self, deadline: float, total: Optional[int]) -> int:
+        sent = 0
+
+        async def worker():
+            nonlocal sent
+            while time.perf_counter() < deadline and (total is None or sent < total):
+                sent += 1
+                await self.send(self.sample())
+
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+        return sent
+
+    async def open_loop(self, deadline: float, total: Optional[int]) -> int:
+        """Poisson arrivals at --rate; at most --concurrency requests outstanding"""
+        slots = asyncio.Semaphore(self.args.concurrency)
+        tasks = []
+
+        async def limited(payload):
+            async with slots:
+                await self.send(payload)
+
+        next_arrival = time.perf_counter()
+        while next_arrival < deadline and (total is None or len(tasks) < total):
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(limited(self.sample())))
+            next_arrival += self.rng.expovariate(self.args.rate)
+        await asyncio.gather(*tasks)
+        return len(tasks)
+
+    async def run(self) -> dict:
+        args = self.args
+        deadline = time.perf_counter() + (args.duration if args.duration else float("inf"))
+        total = args.requests if args.requests or not args.duration else None
+        started = time.perf_counter()
+        if args.rate > 0:
+            sent = await self.open_loop(deadline, total)
+        else:
+            sent = await self.closed_loop(deadline, total)
+        elapsed = time.perf_counter() - started
+        server_metrics = (await self.request("GET", "/metrics"))[1]
+        return self.report(sent, elapsed, server_metrics)
+
+    def report(self, sent: int, elapsed: float, server_metrics: dict) -> dict:
+        completed = sum(self.statuses.values())
+        ok = self.statuses.get(200, 0)
+        return {
+            "config": dict({key: value for key, value in vars(self.args).items()
+                            if key not in ("output", "compare", "serve", "state_dir", "trace_path")},
+                           server=cache_settings()),
+            "git_revision": git_revision(),
+            "timestamp": time.time(),
+            "sent": sent,
+            "completed": completed,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(ok / elapsed, 2) if elapsed else 0.0,
+            "status_counts": {str(status): count for status, count in sorted(self.statuses.items())},
+            "exceptions": dict(self.exceptions),
+            "error_rate": round(1 - ok / sent, 4) if sent else 0.0,
+            "cached_fraction": round(self.cached / ok, 4) if ok else 0.0,
+            "degraded_fraction": round(self.degraded / ok, 4) if ok else 0.0,
+            "latency_ms": summarize(self.latencies),
+            "stages_ms": None,  # filled from the exported traces once the app has flushed them
+            "server_counters": server_metrics.get("counters", {}) if server_metrics else {},
+        }
+
+def git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+def isolate_environment(args) -> None:
+    """
+    Point every file the app writes at the run's temporary directory and, with
+    --no-cache, turn the caches off. Set before config is first imported; the
+    uvicorn child inherits the environment.
+    """
+    args.trace_path = os.path.join(args.state_dir, "traces.jsonl")
+    os.environ["TRACE_EXPORT_PATH"] = args.trace_path
+    os.environ["DEPARTMENT_PROFILES_PATH"] = os.path.join(args.state_dir, "department_profiles.json")
+    os.environ["ROUTER_MODEL_PATH"] = os.path.join(args.state_dir, "router_model.json")
+    os.environ["ROUTER_LOG_PATH"] = os.path.join(args.state_dir, "router_log.jsonl")
+    if args.no_cache:
+        os.environ["NEARDUP_ENABLED"] = "false"
+        os.environ["DEPARTMENT_CACHE_TTL_SECONDS"] = json.dumps({"travel": 0, "news": 0, "joke": 0})
+        os.environ["PROFILE_CACHE_TTL_SECONDS"] = "0"
+
+def cache_settings() -> dict:
+    import config
+    return {name: getattr(config, name) for name in CACHE_SETTINGS}
+
+def install_stub(args) -> None:
+    from config import set_openai_client
+    from stub_upstream import StubUpstream
+    set_openai_client(StubUpstream(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                   seed=args.seed))
+
+async def run_in_process(args) -> dict:
+    from startup_benchmark import asgi_request
+    install_stub(args)
+    import main
+    test = LoadTest(args)
+
+    async def request(method, path, payload=None):
+        try:
+            return await asgi_request(main.app, method, path, payload)
+        except Exception:
+            return 500, None  # the app re-raises after sending its 500 response
+
+    test.request = request
+    result = await test.run()
+    import tracing
+    tracing.flush_exports()
+    return result
+
+async def run_uvicorn(args) -> dict:
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(args.port), "--latency", str(args.latency),
+         "--jitter", str(args.jitter), "--error-rate", str(args.error_rate), "--seed", str(args.seed)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(100):
+            try:
+                await http_request(args.port, "GET", "/")
+                break
+            except OSError:
+                await asyncio.sleep(0.1)
+        else:
+            raise RuntimeError(f"uvicorn did not start on port {args.port}")
+        test = LoadTest(args)
+        test.request = lambda method, path, payload=None: http_request(args.port, method, path, payload)
+        return await test.run()
+    finally:
+        server.terminate()
+        server.wait()
+
+def serve(args) -> None:
+    """Child process for --mode uvicorn: main.app on the stub upstream"""
+    import uvicorn
+    install_stub(args)
+    import main
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+def print_report(result: dict) -> None:
+    print(f"Sent {result['sent']} requests in {result['elapsed_s']} s: {result['throughput_rps']} req/s, "
+          f"error rate {result['error_rate']:.2%}, cached {result['cached_fraction']:.1%}, "
+          f"degraded {result['degraded_fraction']:.1%}")
+    print(f"Status counts: {result['status_counts']}  exceptions: {result['exceptions']}")
+    server = result["config"]["server"]
+    print(f"Caches: near-duplicate {'on' if server['NEARDUP_ENABLED'] else 'off'}, "
+          f"department TTLs {server['DEPARTMENT_CACHE_TTL_SECONDS']}")
+    print(f"\n{'stage':14} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8}")
+    print("-" * 60)
+    rows = [("request", result["latency_ms"], None)] + [(s, v, v["error_rate"]) for s, v in result["stages_ms"].items()]
+    for name, summary, error_rate in rows:
+        if summary["count"]:
+            errors = f"{error_rate:.2%}" if error_rate is not None else ""
+            print(f"{name:14} {summary['count']:7} {summary['p50']:9.2f} {summary['p95']:9.2f} "
+                  f"{summary['p99']:9.2f} {errors:>8}")
+
+def print_comparison(result: dict, baseline: dict) -> None:
+    print(f"\nAgainst {baseline.get('git_revision') or 'baseline'}:")
+    differing = [name for name, value in result["config"]["server"].items()
+                 if baseline["config"].get("server", {}).get(name) != value]
+    if differing:
+        print(f"  Warning: cache settings differ from the baseline: {', '.join(differing)}")
+    pairs = [("throughput_rps", result["throughput_rps"], baseline["throughput_rps"]),
+             ("error_rate", result["error_rate"], baseline["error_rate"])]
+    for pct in ("p50", "p95", "p99"):
+        pairs.append((f"latency {pct} ms", result["latency_ms"].get(pct), baseline["latency_ms"].get(pct)))
+    for name, new, old in pairs:
+        if new is None or old is None:
+            continue
+        change = f"{(new - old) / old:+.1%}" if old else "n/a"
+        print(f"  {name:18} {old:10.3f} -> {new:10.3f}  ({change})")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test main.app against the local upstream stand-in")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--rate", type=float, default=0.0, help="Poisson arrivals per second (0 = closed loop)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Maximum outstanding requests")
+    parser.add_argument("--requests", type=int, default=0, help="Requests to send (default 200 without --duration)")
+    parser.add_argument("--duration", type=float, default=0.0, help="Seconds to run")
+    parser.add_argument("--mix", help="JSONL file of /process bodies with optional weight")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub upstream latency per call, seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra uniform stub latency, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub upstream calls that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Disable the near-duplicate index and department caches")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if not args.requests and not args.duration:
+        args.requests = 200
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.serve:
+        serve(args)
+        sys.exit(0)
+
+    print("LOAD TEST")
+    print("=" * 60)
+    runner = run_uvicorn if args.mode == "uvicorn" else run_in_process
+    with tempfile.TemporaryDirectory() as state_dir:
+        args.state_dir = state_dir
+        isolate_environment(args)
+        result = asyncio.run(runner(args))
+        result["stages_ms"] = stage_stats(args.trace_path)
+    print_report(result)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(result, json.load(f))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nSaved results to {args.output}")
@@ -1,20 +1,115 @@
+import asyncio
+import math
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import Optional
+from datetime import date
+from typing import List, Optional
 from feeder import feeder_process
-from interpreter import interpreter_process
-from departments import handle_department
-from gittertalk import gittertalk_to_string
+from interpreter import interpreter_process_intents, interpreter_delta
+from departments import handle_department, strict_fallback_department
+from gittertalk import CompactGittertalk, gittertalk_to_string
+from config import (
+    DEPARTMENT_TOKEN_BUDGETS, WARMUP_ON_STARTUP, ADMISSION_REJECT_STATUS, ADMISSION_RETRY_AFTER,
+    DEGRADED_BUDGET_SCALE, CANONICALIZE_GITTERTALK, NEARDUP_ENABLED, NEARDUP_REUSE_RESPONSE
+)
+from canonical import canonicalize, variants
+from admission import Overloaded, admission
+from jobs import is_local_url, jobs, public_view
+from neardup import near_duplicates
+from sessions import sessions
+from profiles import BUILTIN_DEPARTMENTS, profiles
+from router import log_example, route_department, strict_precheck
+import metrics
+import tracing
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Optional warm-up so the first request does not pay for client and table construction
+    if WARMUP_ON_STARTUP:
+        from warmup import warm_up
+        app.state.warmup = warm_up()
+    yield
+    await jobs.stop()
+    tracing.flush_exports()
+
+app = FastAPI(lifespan=lifespan)
 
 class HumanRequest(BaseModel):
     request: str
     fallback_mode: Optional[str] = "adaptive"  # "adaptive" or "strict"
     verbose: Optional[int] = 2  # 1=full format, 2=abbreviated, 4=stenographic (default: level 2)
+    max_tokens: Optional[int] = None  # Lowers the department output budget (capped at the per-department budget)
+    session_id: Optional[str] = None  # Follow-up turns in a session send only a gittertalk delta
+    reference_date: Optional[date] = None  # Day relative dates resolve against (default: today)
+    debug: Optional[bool] = False  # Return the request's span timeline inline as "trace"
 
 @app.post("/process")
 async def process_request(human: HumanRequest):
+    # Admission control: bounded in-flight work, fast rejection once the queue is full
+    try:
+        async with admission.admit() as degradation:
+            return await run_pipeline(human, degradation)
+    except Overloaded as e:
+        return JSONResponse(
+            status_code=ADMISSION_REJECT_STATUS,
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+            content={"error": f"Server overloaded ({e.reason}). Retry later.", "retry_after": e.retry_after}
+        )
+
+class JobRequest(HumanRequest):
+    callback_url: Optional[str] = None  # Local URL that receives the finished job as a JSON POST
+
+@app.post("/jobs", status_code=202)
+async def submit_job(job_request: JobRequest):
+    """Enqueue a request and return its job id at once; poll GET /jobs/{id} or wait for the callback."""
+    if job_request.callback_url and not is_local_url(job_request.callback_url):
+        return JSONResponse(status_code=400, content={"error": "callback_url must be an http(s) URL on localhost."})
+    job = jobs.submit(job_request, job_request.callback_url)
+    if job is None:
+        return JSONResponse(
+            status_code=ADMISSION_REJECT_STATUS,
+            headers={"Retry-After": str(math.ceil(ADMISSION_RETRY_AFTER))},
+            content={"error": "Job queue full. Retry later.", "retry_after": ADMISSION_RETRY_AFTER}
+        )
+    return {"job_id": job["id"], "status": job["status"], "status_url": f"/jobs/{job['id']}"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.store.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown or expired job id."})
+    return public_view(job)
+
+async def run_job(human: HumanRequest) -> dict:
+    """Job worker handler: shares admission with /process, waiting out overload instead of failing"""
+    while True:
+        try:
+            async with admission.admit() as degradation:
+                return await run_pipeline(human, degradation)
+        except Overloaded as e:
+            await asyncio.sleep(e.retry_after)
+
+jobs.handler = run_job
+
+async def run_pipeline(human: HumanRequest, degradation: List[str] = ()) -> dict:
+    """
+    Feeder → interpreter → department for one request, traced.
+    degradation lists the load-shedding steps active for this request.
+    """
+    trace = tracing.begin_trace()
+    try:
+        with tracing.span("pipeline", fallback_mode=human.fallback_mode or "adaptive",
+                          degraded=",".join(degradation)):
+            response = await execute_pipeline(human, degradation)
+    finally:
+        tracing.end_trace(trace)
+    if human.debug:
+        response["trace"] = trace.timeline()
+    return response
+
+async def execute_pipeline(human: HumanRequest, degradation: List[str] = ()) -> dict:
     # Validate verbose level - only 1, 2, and 4 are supported
     verbose_level = human.verbose or 2
     if verbose_level not in [1, 2, 4]:
@@ -27,20 +122,152 @@ async def process_request(human: HumanRequest):
             }
         }
     
-    # 1. Feeder step: Human → Structured
-    structured = await feeder_process(human.request)
-    # 2. Interpreter step: Structured → gittertalk (+ department)
+    if human.max_tokens is not None and human.max_tokens < 1:
+        return {"error": "Invalid max_tokens. Must be a positive integer."}
+    
     fallback_mode = human.fallback_mode or "adaptive"
-    gittertalk, department = await interpreter_process(structured, verbose_level)
-    # 3. Department step: gittertalk → Final response
-    result = await handle_department(department, gittertalk, fallback_mode)
-    return {
+    ledger = metrics.begin_request_usage()
+    if "verbose_4" in degradation:
+        # Format only: the interpreter and departments work from level 2 regardless
+        verbose_level = 4
+    budget_scale = DEGRADED_BUDGET_SCALE if "tight_budgets" in degradation else 1.0
+    allow_stale = "stale_cache" in degradation
+    tracing.current_span().set(verbose_level=verbose_level)
+    
+    # Follow-up turn: merge an interpreter delta onto the session's last gittertalk
+    session = None
+    if human.session_id:
+        with tracing.span("cache.lookup", cache="session") as lookup:
+            session = sessions.get(human.session_id)
+            lookup.set(hit=session is not None)
+    
+    # Strict mode: refuse confidently out-of-scope requests before any upstream call
+    if fallback_mode == "strict" and session is None:
+        rejected_department = strict_precheck(human.request)
+        if rejected_department:
+            metrics.increment("strict.precheck.rejected")
+            metrics.increment("upstream.calls_avoided", 2)
+            result, _ = await strict_fallback_department(rejected_department, BUILTIN_DEPARTMENTS)
+            return {
+                "gittertalk": gittertalk_to_string(CompactGittertalk("unknown", "unknown"), verbose_level),
+                "department": rejected_department,
+                "result": result,
+                "fallback_mode": fallback_mode,
+                "verbose_level": verbose_level,
+                "usage": {"token_budget": 0, "completion_tokens": 0, "cached": False},
+                "prechecked": True
+            }
+        metrics.increment("strict.precheck.passed")
+    delta = None
+    intents = None
+    if session:
+        followed = await interpreter_delta(human.request, session["gittertalk"], session["department"])
+        if followed:
+            gittertalk, department, delta = followed
+            intents = [(gittertalk, department)]
+    
+    # Near-duplicate of a recent request: reuse its interpreter result
+    near_duplicate = None
+    neardup_entry = None
+    signature = None
+    if intents is None and NEARDUP_ENABLED:
+        with tracing.span("cache.lookup", cache="near_duplicate") as lookup:
+            signature = near_duplicates.signature(human.request)
+            near_duplicate = near_duplicates.lookup(human.request, signature)
+            lookup.set(hit=near_duplicate is not None)
+        if near_duplicate:
+            neardup_entry, similarity = near_duplicate
+            intents = neardup_entry["intents"]
+            metrics.increment("upstream.calls_avoided", 2)
+    
+    if intents is None:
+        # 1. Feeder step: Human → Structured (skipped on the fast path; the interpreter reads the raw request)
+        fast_path = "fast_path" in degradation
+        structured = human.request if fast_path else await feeder_process(human.request)
+        # 2. Interpreter step: Structured → one (gittertalk, department) pair per intent
+        intents = await interpreter_process_intents(structured, verbose_level)
+        if len(intents) == 1 and not fast_path:
+            log_example(structured, intents[0][1])
+            # A confident local router decision replaces the interpreter's department
+            routed = route_department(structured)
+            if routed:
+                metrics.increment("router.agree" if routed[0] == intents[0][1] else "router.override")
+                intents = [(intents[0][0], routed[0])]
+        # Fast-path intents come from the raw request; don't serve them to later non-degraded requests
+        if NEARDUP_ENABLED and not fast_path:
+            neardup_entry = {"intents": intents, "responses": {}}
+            near_duplicates.insert(human.request, neardup_entry, signature)
+    if CANONICALIZE_GITTERTALK:
+        # Equivalent requests share one department cache key
+        intents = [(canonicalize(gittertalk, human.reference_date), department) for gittertalk, department in intents]
+    input_tokens = sum(ledger.get(stage, {}).get("prompt_tokens", 0) for stage in ("feeder", "interpreter"))
+    
+    # 3. Department step: intents run concurrently, results stay in request order
+    # Department responses are only shared between near-duplicates with the same options
+    response_key = (fallback_mode, human.max_tokens, budget_scale)
+    reused = None
+    if near_duplicate and NEARDUP_REUSE_RESPONSE:
+        reused = neardup_entry["responses"].get(response_key)
+    if reused:
+        outcomes = [(result, dict(usage, completion_tokens=0, cached=True)) for result, usage in reused]
+        metrics.increment("upstream.calls_avoided", len(outcomes))
+    else:
+        with tracing.span("dispatch", intents=len(intents)):
+            outcomes = await asyncio.gather(*(
+                handle_department(department, gittertalk, fallback_mode, human.max_tokens, budget_scale, allow_stale)
+                for gittertalk, department in intents
+            ))
+        # As with the department cache, replies cut off by the budget or from the generic error fallback are not reused
+        complete = all(usage["completion_tokens"] < usage["token_budget"] and not usage.get("fallback")
+                       for _, usage in outcomes)
+        if neardup_entry is not None and NEARDUP_REUSE_RESPONSE and complete:
+            neardup_entry["responses"][response_key] = outcomes
+    gittertalk, department = intents[0]
+    result, usage = outcomes[0]
+    response = {
         "gittertalk": gittertalk_to_string(gittertalk, verbose_level),
         "department": department,
         "result": result,
         "fallback_mode": fallback_mode,
-        "verbose_level": verbose_level
+        "verbose_level": verbose_level,
+        "usage": usage
     }
+    if degradation:
+        response["degraded"] = list(degradation)
+    if near_duplicate:
+        response["near_duplicate"] = {"similarity": similarity, "reused_response": bool(reused)}
+    
+    if len(intents) > 1:
+        # Top-level fields describe the first intent; result and usage cover all of them
+        response["result"] = "\n\n".join(result for result, _ in outcomes)
+        response["usage"] = {
+            "token_budget": sum(usage["token_budget"] for _, usage in outcomes),
+            "completion_tokens": sum(usage["completion_tokens"] for _, usage in outcomes)
+        }
+        response["intents"] = [
+            {
+                "gittertalk": gittertalk_to_string(intent_gittertalk, verbose_level),
+                "department": intent_department,
+                "result": intent_result,
+                "usage": intent_usage
+            }
+            for (intent_gittertalk, intent_department), (intent_result, intent_usage) in zip(intents, outcomes)
+        ]
+    
+    if human.session_id:
+        # Fresh turns set the baseline cost a follow-up is compared against
+        fresh_input_tokens = session["fresh_input_tokens"] if delta is not None else input_tokens
+        stored = sessions.put(human.session_id, gittertalk, department, fresh_input_tokens)
+        response["session"] = {
+            "id": human.session_id,
+            "turn": stored["turn"],
+            "delta": delta,
+            "input_tokens": input_tokens,
+            "input_tokens_saved": max(fresh_input_tokens - input_tokens, 0)
+        }
+        if delta is not None:
+            metrics.observe("session.input_tokens_saved", response["session"]["input_tokens_saved"])
+    return response
 
 @app.get("/")
 async def root():
@@ -48,16 +275,23 @@ async def root():
         "message": "Transdepo API",
         "endpoints": {
             "/process": "Main processing endpoint",
-            "/info": "API information and options"
+            "/jobs": "Asynchronous processing: POST a request, poll /jobs/{id}",
+            "/info": "API information and options",
+            "/metrics": "Pipeline counters and summaries"
         }
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    return dict(metrics.snapshot(), admission=admission.state(), jobs=jobs.state(), canonical=variants.summary())
+
 @app.get("/info")
 async def api_info():
     return {
         "api_name": "Transdepo API",
         "description": "Multi-stage AI processing pipeline",
         "available_departments": ["travel", "news", "joke"],
+        "promoted_departments": profiles.promoted(),
         "fallback_modes": {
             "adaptive": "Creates new departments on the spot (default)",
             "strict": "Only handles requests for existing departments"
@@ -70,8 +304,13 @@ async def api_info():
         "request_format": {
             "request": "string (required) - Your request text",
             "fallback_mode": "string (optional) - 'adaptive' or 'strict', defaults to 'adaptive'",
-            "verbose": "integer (optional) - 1, 2, or 4, gittertalk efficiency level, defaults to 2"
+            "verbose": "integer (optional) - 1, 2, or 4, gittertalk efficiency level, defaults to 2",
+            "max_tokens": "integer (optional) - department output token budget, at most (and by default) the department's budget",
+            "session_id": "string (optional) - reuse across turns so follow-ups send only a gittertalk delta",
+            "reference_date": "string (optional) - ISO date relative dates resolve against, defaults to today",
+            "debug": "boolean (optional) - include the request's span timeline as 'trace'"
         },
+        "department_token_budgets": DEPARTMENT_TOKEN_BUDGETS,
         "example_requests": [
             {
                 "request": "Book a flight to NYC",
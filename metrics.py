@@ -0,0 +1,64 @@
+from collections import defaultdict
+from contextvars import ContextVar
+from threading import Lock
+from typing import Dict, Optional
+
+# Simple in-process counters and value summaries, exposed through GET /metrics
+_lock = Lock()
+_counters: Dict[str, int] = defaultdict(int)
+_observations: Dict[str, Dict[str, float]] = {}
+# Per-request token ledger, keyed by pipeline stage
+_request_usage: ContextVar[Optional[Dict[str, Dict[str, int]]]] = ContextVar("request_usage", default=None)
+
+def increment(name: str, amount: int = 1) -> None:
+    """Add amount to a named counter."""
+    with _lock:
+        _counters[name] += amount
+
+def observe(name: str, value: float) -> None:
+    """Record one value for a named summary (count, sum, min, max)."""
+    with _lock:
+        summary = _observations.get(name)
+        if summary is None:
+            _observations[name] = {"count": 1, "sum": value, "min": value, "max": value}
+        else:
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["min"] = min(summary["min"], value)
+            summary["max"] = max(summary["max"], value)
+
+def snapshot() -> dict:
+    """Return a copy of all counters and summaries."""
+    with _lock:
+        summaries = {}
+        for name, summary in _observations.items():
+            summaries[name] = dict(summary, avg=summary["sum"] / summary["count"])
+        return {"counters": dict(_counters), "summaries": summaries}
+
+def reset() -> None:
+    """Clear all metrics (used by tests and benchmarks)."""
+    with _lock:
+        _counters.clear()
+        _observations.clear()
+
+def begin_request_usage() -> Dict[str, Dict[str, int]]:
+    """Start a token ledger for the current request and return it."""
+    ledger: Dict[str, Dict[str, int]] = {}
+    _request_usage.set(ledger)
+    return ledger
+
+def record_usage(stage: str, usage) -> None:
+    """Record an upstream usage object against a stage, globally and in the request ledger."""
+    if usage is None:
+        return
+    observe(f"{stage}.prompt_tokens", usage.prompt_tokens)
+    observe(f"{stage}.completion_tokens", usage.completion_tokens)
+    record_request_usage(stage, usage.prompt_tokens, usage.completion_tokens)
+
+def record_request_usage(stage: str, prompt_tokens: int, completion_tokens: int) -> None:
+    """Add tokens to the current request ledger only, e.g. a share of usage already recorded globally."""
+    ledger = _request_usage.get()
+    if ledger is not None:
+        entry = ledger.setdefault(stage, {"prompt_tokens": 0, "completion_tokens": 0})
+        entry["prompt_tokens"] += prompt_tokens
+        entry["completion_tokens"] += completion_tokens
@@ -0,0 +1,145 @@
+import hashlib
+import re
+import time
+from array import array
+from collections import deque
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+from config import NEARDUP_THRESHOLD, NEARDUP_MAX_ENTRIES, NEARDUP_TTL_SECONDS
+import metrics
+
+# Words that change the phrasing of a request but not what is asked for
+FILLER_WORDS = {
+    "please", "pls", "plz", "kindly", "okay", "ok", "so", "um", "uh", "hey", "hi", "hello", "thanks", "thank",
+    "can", "could", "would", "will", "you", "u", "i", "im", "me", "my", "we", "us", "need", "want", "like",
+    "just", "really", "actually", "also", "maybe", "tell", "let", "know", "is", "are", "there", "theres",
+    "a", "an", "the", "any", "some", "if", "whether", "do", "does", "get", "give", "find", "show", "check",
+}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# MinHash signature of NUM_PERM 32-bit values; the first BANDS * ROWS form the LSH bands,
+# the full signature estimates the similarity of each candidate
+NUM_PERM = 32
+BANDS = 6
+ROWS = 4
+
+# "to" after these is an infinitive marker ("need to get a flight"), not a destination
+_INFINITIVE_VERBS = {"need", "needs", "want", "wants", "like", "have", "has", "able", "trying", "going"}
+
+def normalize_request(text: str) -> List[str]:
+    """Lowercase words of a request with filler removed"""
+    raw = _WORD_RE.findall(text.lower().replace("'", ""))
+    return [
+        word for i, word in enumerate(raw)
+        if word not in FILLER_WORDS
+        and not (word == "to" and i and raw[i - 1] in _INFINITIVE_VERBS and i + 1 < len(raw) and raw[i + 1] in FILLER_WORDS)
+    ]
+
+def shingles(words: List[str]) -> set:
+    """Word unigrams and bigrams"""
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+def minhash(features: set) -> bytes:
+    """Per slot, the minimum over features of an independent 32-bit hash (one SHAKE-128 digest per feature)"""
+    rows = [array("I", hashlib.shake_128(feature.encode("utf-8")).digest(NUM_PERM * 4)) for feature in features]
+    return array("I", map(min, zip(*rows))).tobytes()
+
+def similarity(first: bytes, second: bytes) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(x == y for x, y in zip(memoryview(first).cast("I"), memoryview(second).cast("I"))) / NUM_PERM
+
+def content_anchor(words: List[str]) -> int:
+    """
+    Hash of the non-filler words of a request in first-occurrence order. It is
+    mixed into every band key, so requests that differ in any content word (a city,
+    a day, a number or a "not") or in their order ("from A to B" vs "from B to A")
+    are never candidates, however long the request. Repeated words are ignored.
+    """
+    return hash(tuple(dict.fromkeys(words)))
+
+def _band_keys(signature: bytes, anchor: int) -> List[int]:
+    width = ROWS * 4
+    return [hash(signature[band * width:(band + 1) * width]) ^ anchor for band in range(BANDS)]
+
+class NearDuplicateIndex:
+    """
+    Approximate-match index over normalized request text: MinHash signatures
+    bucketed by LSH bands. Bounded to max_entries, oldest evicted first, and
+    entries expire after ttl_seconds.
+    """
+
+    def __init__(self, threshold: float = NEARDUP_THRESHOLD, max_entries: int = NEARDUP_MAX_ENTRIES,
+                 ttl_seconds: float = NEARDUP_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[int, Tuple[bytes, int, Any, float]] = {}
+        self._order: deque = deque()
+        self._buckets: List[Dict[int, int]] = [{} for _ in range(BANDS)]
+        self._next_id = 0
+        self._lock = Lock()
+
+    @staticmethod
+    def signature(text: str) -> Optional[Tuple[bytes, int]]:
+        """MinHash signature and content anchor of a request, or None if it is all filler"""
+        words = normalize_request(text)
+        features = shingles(words)
+        return (minhash(features), content_anchor(words)) if features else None
+
+    def lookup(self, text: str, signature: Optional[Tuple[bytes, int]] = None) -> Optional[Tuple[Any, float]]:
+        """Value of the most similar live entry at or above the threshold, with its similarity"""
+        signature = signature or self.signature(text)
+        if signature is None:
+            return None
+        minhashes, anchor = signature
+        now = time.monotonic()
+        best, best_similarity = None, self.threshold
+        with self._lock:
+            candidates = {bucket.get(key) for bucket, key in zip(self._buckets, _band_keys(minhashes, anchor))}
+            candidates.discard(None)
+            for entry_id in candidates:
+                stored, stored_anchor, value, expires_at = self._entries[entry_id]
+                if expires_at < now or stored_anchor != anchor:
+                    continue
+                score = similarity(minhashes, stored)
+                if score >= best_similarity:
+                    best, best_similarity = value, score
+        if best is None:
+            metrics.increment("neardup.miss")
+            return None
+        metrics.increment("neardup.hit")
+        return best, best_similarity
+
+    def insert(self, text: str, value: Any, signature: Optional[Tuple[bytes, int]] = None) -> None:
+        signature = signature or self.signature(text)
+        if signature is None:
+            return
+        minhashes, anchor = signature
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (minhashes, anchor, value, time.monotonic() + self.ttl_seconds)
+            self._order.append(entry_id)
+            for bucket, key in zip(self._buckets, _band_keys(minhashes, anchor)):
+                bucket[key] = entry_id  # newest entry wins a shared bucket
+            while len(self._entries) > self.max_entries:
+                self._evict(self._order.popleft())
+
+    def _evict(self, entry_id: int) -> None:
+        minhashes, anchor, _, _ = self._entries.pop(entry_id)
+        for bucket, key in zip(self._buckets, _band_keys(minhashes, anchor)):
+            if bucket.get(key) == entry_id:
+                del bucket[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._order.clear()
+            for bucket in self._buckets:
+                bucket.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+near_duplicates = NearDuplicateIndex()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate index benchmark - match quality on paraphrase pairs, insert rate,
+memory and lookup latency (hits and misses) at up to a million entries
+
+    python neardup_benchmark.py [entries]   # default 1000000
+"""
+import random
+import resource
+import statistics
+import sys
+import time
+from neardup import NearDuplicateIndex
+
+# (first, second, should match)
+PAIRS = [
+    ("okay so im coming from NYC. i need to get a flight to Los Angeles TOMORROW. PLEASE tell me theres one available",
+     "I'm coming from NYC, I need a flight to Los Angeles tomorrow, is there one available?", True),
+    ("PLEASE tell me theres one available", "is there one available?", True),
+    ("What's happening in the news today?", "whats happening in the news today", True),
+    ("Can you please book a hotel in Denver for Friday", "book a hotel in Denver for Friday", True),
+    ("Hey, could you find me directions from Zanesville to Columbus?", "directions from Zanesville to Columbus", True),
+    ("book a flight to denver tomorrow", "book a flight to denver today", False),
+    ("flight from columbus to denver", "flight from denver to columbus", False),
+    ("Tell me a joke", "tell me a funny joke", False),
+    ("hotel in Boston for the weekend", "car rental in Boston for the weekend", False),
+    # Long requests that differ in one city, day, a negation or the word order must not match
+    ("okay so i need to book a flight from Columbus Ohio to Chicago tomorrow morning in economy class with one checked bag",
+     "okay so i need to book a flight from Columbus Ohio to Denver tomorrow morning in economy class with one checked bag",
+     False),
+    ("okay so i need to book a flight from Columbus Ohio to Chicago tomorrow morning in economy class with one checked bag",
+     "okay so i need to book a flight from Columbus Ohio to Miami tomorrow morning in economy class with one checked bag",
+     False),
+    ("please reserve a hotel room in downtown Seattle near the convention center for Friday night with free parking",
+     "please reserve a hotel room in downtown Seattle near the convention center for Saturday night with free parking",
+     False),
+    ("Do not book the rental car at the Denver airport for next week, I will take the train instead",
+     "Book the rental car at the Denver airport for next week, I will take the train instead", False),
+    ("i need to book a flight from denver to chicago tomorrow morning in economy class with one checked bag and a "
+     "hotel near the airport for three nights with free parking and breakfast included and a rental car for the whole week",
+     "i need to book a flight from chicago to denver tomorrow morning in economy class with one checked bag and a "
+     "hotel near the airport for three nights with free parking and breakfast included and a rental car for the whole week",
+     False),
+    ("could you please tell me whether there are any direct flights from Boston to Atlanta on Monday afternoon",
+     "are there direct flights from Boston to Atlanta on Monday afternoon", True),
+]
+
+CITIES = ["columbus", "denver", "boston", "austin", "miami", "seattle", "chicago", "atlanta", "portland", "phoenix",
+          "dallas", "houston", "detroit", "nashville", "orlando", "tampa", "reno", "omaha", "tulsa", "memphis"]
+ACTIONS = ["book a flight", "reserve a hotel", "rent a car", "get directions", "find a train", "news about",
+           "weather forecast", "restaurants", "museums", "concerts"]
+WHEN = ["today", "tomorrow", "friday", "saturday", "next week", "this weekend", "monday morning", "tonight"]
+FILLER = ["please", "can you", "i need to", "hey", "okay so", "could you", ""]
+
+def synthetic_request(rng: random.Random, n: int) -> str:
+    """Distinct requests: a booking reference keeps every entry unique"""
+    return (f"{rng.choice(FILLER)} {rng.choice(ACTIONS)} from {rng.choice(CITIES)} to {rng.choice(CITIES)} "
+            f"{rng.choice(WHEN)} reference {n}")
+
+def match_quality() -> None:
+    print("\nMatch quality (threshold 0.8)")
+    print("-" * 60)
+    correct = 0
+    for first, second, expected in PAIRS:
+        index = NearDuplicateIndex(threshold=0.8, max_entries=10)
+        index.insert(first, "first")
+        hit = index.lookup(second)
+        matched = hit is not None
+        correct += matched == expected
+        score = f"{hit[1]:.2f}" if hit else "  - "
+        print(f"  {'ok  ' if matched == expected else 'MISS'} match={matched!s:5} sim={score}  {second[:60]}")
+    print(f"  {correct}/{len(PAIRS)} pairs as expected")
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def scale(entries: int) -> None:
+    rng = random.Random(0)
+    index = NearDuplicateIndex(threshold=0.8, max_entries=entries, ttl_seconds=3600)
+    value = {"intents": []}
+    baseline = rss_mb()
+
+    print(f"\nInserting {entries:,} entries")
+    print("-" * 60)
+    started = time.perf_counter()
+    for n in range(entries):
+        index.insert(synthetic_request(rng, n), value)
+    elapsed = time.perf_counter() - started
+    print(f"  {elapsed:.1f} s, {elapsed / entries * 1e6:.1f} us/insert, ~{rss_mb() - baseline:.0f} MB resident")
+
+    # Hits: paraphrases of stored requests; misses: requests never stored
+    probes = random.Random(0)
+    stored = [synthetic_request(probes, n) for n in range(2000)]
+    hit_queries = [f"please {text} thanks" for text in stored]
+    miss_queries = [synthetic_request(random.Random(n), entries + n) for n in range(2000)]
+    for label, queries in (("hit", hit_queries), ("miss", miss_queries)):
+        timings, found = [], 0
+        for query in queries:
+            started = time.perf_counter()
+            found += index.lookup(query) is not None
+            timings.append((time.perf_counter() - started) * 1e6)
+        timings.sort()
+        print(f"  lookup {label:4}  p50 {statistics.median(timings):6.1f} us  "
+              f"p99 {timings[int(len(timings) * 0.99)]:6.1f} us  found {found}/{len(queries)}")
+
+    # Eviction keeps the index bounded
+    for n in range(entries, entries + 1000):
+        index.insert(synthetic_request(rng, n), value)
+    print(f"  after 1,000 more inserts: {len(index):,} entries (bound {entries:,})")
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print("NEAR-DUPLICATE INDEX BENCHMARK")
+    print("=" * 60)
+    match_quality()
+    scale(count)
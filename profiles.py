@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional
+from config import (
+    DEPARTMENT_PROFILES_PATH, PROFILE_PROMOTION_THRESHOLD, PROFILE_CACHE_TTL_SECONDS,
+    PROFILE_MAX_COUNT, PROFILE_TRACKED_NAMES, DEPARTMENT_TOKEN_BUDGETS, DEPARTMENT_MIN_TOKENS
+)
+import metrics
+
+BUILTIN_DEPARTMENTS = ["travel", "news", "joke"]
+# Catch-all names the interpreter uses when nothing fits; never promoted
+_UNPROMOTABLE = {"generic", "other", "unknown", "general"}
+
+# Name variants the interpreter produces for the same department
+DEPARTMENT_ALIASES = {
+    "forecast": "weather", "weather forecast": "weather", "meteorology": "weather", "climate": "weather",
+    "recipe": "cooking", "recipes": "cooking", "food": "cooking", "cuisine": "cooking",
+    "sport": "sports", "scores": "sports",
+    "stocks": "finance", "stock market": "finance", "investing": "finance",
+    "medical": "health", "fitness": "health",
+    "tech": "technology", "tech support": "technology", "computers": "technology",
+    "movies": "entertainment", "film": "entertainment", "music": "entertainment",
+    "trip": "travel", "trips": "travel", "flights": "travel", "flight": "travel", "hotels": "travel",
+    "current events": "news", "headlines": "news",
+    "jokes": "joke", "humor": "joke", "humour": "joke", "comedy": "joke",
+}
+
+_NAME_SUFFIXES = (" department", " dept", " assistant", " ai")
+
+def normalize_department(name: str) -> str:
+    """Canonical department name: lowercase, without filler suffixes, aliases resolved"""
+    name = " ".join(name.lower().replace("_", " ").replace("-", " ").split()).strip("'\".")
+    for suffix in _NAME_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)].strip()
+    return DEPARTMENT_ALIASES.get(name, name) or "generic"
+
+def build_profile_prompt(name: str) -> str:
+    """Prompt template for a promoted department; {gittertalk} is filled per request."""
+    title = name.title()
+    return (
+        f"You are a {title} Assistant AI. Process this {name} request: {{gittertalk}}\n"
+        f"Interpret the compact request format as a specialist in {name}-related topics. "
+        "Be concise, helpful and professional."
+    )
+
+class ProfileRegistry:
+    """
+    Counts adaptive department names and promotes frequent ones to persisted
+    profiles with a precompiled prompt, cache TTL and token budget.
+    Department names come from the interpreter, so counts are kept for the
+    tracked_names most recently seen names only and at most max_profiles are promoted.
+    """
+
+    def __init__(self, path: str = DEPARTMENT_PROFILES_PATH, threshold: int = PROFILE_PROMOTION_THRESHOLD,
+                 max_profiles: int = PROFILE_MAX_COUNT, tracked_names: int = PROFILE_TRACKED_NAMES):
+        self.path = path
+        self.threshold = threshold
+        self.max_profiles = max_profiles
+        self.tracked_names = tracked_names
+        # name -> [request count, completion token samples], least recently seen first
+        self._counts: "OrderedDict[str, list]" = OrderedDict()
+        self._profiles: Optional[Dict[str, dict]] = None
+        self._lock = Lock()
+        self._save_lock = Lock()
+        self._version = 0
+        self._saved_version = 0
+
+    def _load(self) -> Dict[str, dict]:
+        if self._profiles is None:
+            self._profiles = {}
+            if self.path and os.path.exists(self.path):
+                try:
+                    with open(self.path) as f:
+                        self._profiles = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"Warning: Could not load department profiles from {self.path}: {e}")
+        return self._profiles
+
+    def _save(self, snapshot: str, version: int) -> None:
+        """Write a serialized snapshot unless a newer one was already written."""
+        with self._save_lock:
+            if version <= self._saved_version:
+                return
+            try:
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w") as f:
+                    f.write(snapshot)
+                os.replace(tmp_path, self.path)
+                self._saved_version = version
+            except OSError as e:
+                print(f"Warning: Could not persist department profiles to {self.path}: {e}")
+
+    def _schedule_save(self) -> None:
+        """Persist the profiles; off the event loop when called from a request."""
+        if not self.path:
+            return
+        self._version += 1
+        snapshot, version = json.dumps(self._profiles, indent=2), self._version
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self._save, snapshot, version)
+        except RuntimeError:
+            self._save(snapshot, version)
+
+    def get(self, name: str) -> Optional[dict]:
+        with self._lock:
+            return self._load().get(name)
+
+    def record_request(self, name: str) -> Optional[dict]:
+        """Count one request for an adaptive department; returns its profile once promoted."""
+        if name in _UNPROMOTABLE:
+            return None
+        with self._lock:
+            profiles = self._load()
+            profile = profiles.get(name)
+            if profile is None:
+                entry = self._track(name)
+                entry[0] += 1
+                if entry[0] >= self.threshold:
+                    if len(profiles) < self.max_profiles:
+                        profile = self._promote(name, entry)
+                        del self._counts[name]
+                    elif entry[0] == self.threshold:
+                        metrics.increment("profiles.promotion_skipped")
+                        print(f"Warning: Not promoting department '{name}': {self.max_profiles} profiles already exist")
+            if profile is not None:
+                profile["requests"] += 1
+            return profile
+
+    def _track(self, name: str) -> list:
+        """Counter entry for a name, evicting the least recently seen beyond tracked_names"""
+        entry = self._counts.get(name)
+        if entry is None:
+            entry = self._counts[name] = [0, []]
+            while len(self._counts) > self.tracked_names:
+                self._counts.popitem(last=False)
+        else:
+            self._counts.move_to_end(name)
+        return entry
+
+    def record_usage(self, name: str, completion_tokens: int) -> None:
+        """Remember completion sizes so a promoted profile gets a budget that fits its traffic."""
+        with self._lock:
+            entry = self._counts.get(name)
+            if entry is not None and len(entry[1]) < 100:
+                entry[1].append(completion_tokens)
+
+    def _promote(self, name: str, entry: list) -> dict:
+        count, samples = entry
+        default_budget = DEPARTMENT_TOKEN_BUDGETS["adaptive"]
+        if name in DEPARTMENT_TOKEN_BUDGETS:
+            budget = DEPARTMENT_TOKEN_BUDGETS[name]
+        elif samples:
+            # Headroom over the observed average, never above the adaptive default
+            budget = min(default_budget, max(DEPARTMENT_MIN_TOKENS, int(sum(samples) / len(samples) * 1.5)))
+        else:
+            budget = default_budget
+        profile = {
+            "name": name,
+            "prompt": build_profile_prompt(name),
+            "token_budget": budget,
+            "cache_ttl_seconds": PROFILE_CACHE_TTL_SECONDS,
+            "promoted_at": time.time(),
+            "requests": 0,
+        }
+        self._profiles[name] = profile
+        metrics.increment("profiles.promoted")
+        print(f"Promoted adaptive department '{name}' to a profile after {count} requests")
+        self._schedule_save()
+        return profile
+
+    def promoted(self) -> List[dict]:
+        with self._lock:
+            return [
+                {"name": p["name"], "requests": p["requests"], "token_budget": p["token_budget"],
+                 "cache_ttl_seconds": p["cache_ttl_seconds"]}
+                for p in self._load().values()
+            ]
+
+profiles = ProfileRegistry()
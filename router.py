@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Local department router: a word n-gram naive Bayes classifier with temperature-
+calibrated confidence, trained offline from logged feeder outputs and departments.
+
+    python router.py train router_log.jsonl [model.json]   # fit, evaluate on a held-out split, save
+    python router.py eval router_log.jsonl [model.json]    # accuracy, coverage and latency of a saved model
+"""
+import json
+import math
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+from appendlog import BackgroundAppender
+from config import ROUTER_CONFIDENCE_THRESHOLD, ROUTER_LOG_PATH, ROUTER_MODEL_PATH
+from profiles import BUILTIN_DEPARTMENTS, DEPARTMENT_ALIASES, profiles
+import metrics
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Keyword scope check used by the strict pre-check
+IN_SCOPE_KEYWORDS = {
+    "travel": {"flight", "flights", "fly", "hotel", "hotels", "trip", "travel", "car", "rental", "airport",
+               "book", "booking", "route", "directions", "highway", "drive", "train", "vacation", "ticket"},
+    "news": {"news", "headlines", "happening", "latest", "stock", "stocks", "update", "updates", "events", "report"},
+    "joke": {"joke", "jokes", "funny", "laugh", "pun", "humor", "humour", "comedy", "cheer"},
+}
+_IN_SCOPE = set().union(*IN_SCOPE_KEYWORDS.values())
+# Topics the joke department answers as entertainment; never refused by the pre-check
+_PRECHECK_IN_SCOPE_TOPICS = {"entertainment"}
+# Topic names known to belong to adaptive departments
+_OUT_OF_SCOPE = {d for d in DEPARTMENT_ALIASES.values() if d not in BUILTIN_DEPARTMENTS} - _PRECHECK_IN_SCOPE_TOPICS
+
+def extract_features(text: str) -> List[str]:
+    """Lowercase word unigrams and bigrams"""
+    words = _TOKEN_RE.findall(text.lower())
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+class NgramRouter:
+    """Multinomial naive Bayes over n-gram features with a softmax temperature."""
+
+    def __init__(self, log_priors: Dict[str, float], log_likelihoods: Dict[str, Dict[str, float]],
+                 unseen: Dict[str, float], temperature: float = 1.0):
+        self.log_priors = log_priors
+        self.log_likelihoods = log_likelihoods
+        self.unseen = unseen
+        self.temperature = temperature
+        self.labels = sorted(log_priors)
+
+    @classmethod
+    def train(cls, samples: List[Tuple[str, str]], alpha: float = 0.5, temperature: float = 1.0) -> "NgramRouter":
+        label_counts = Counter(label for _, label in samples)
+        feature_counts: Dict[str, Counter] = defaultdict(Counter)
+        for text, label in samples:
+            feature_counts[label].update(extract_features(text))
+        vocabulary = set()
+        for counts in feature_counts.values():
+            vocabulary.update(counts)
+        vocab_size = len(vocabulary) + 1
+
+        log_priors = {label: math.log(count / len(samples)) for label, count in label_counts.items()}
+        log_likelihoods = {}
+        unseen = {}
+        for label in label_counts:
+            counts = feature_counts[label]
+            denominator = sum(counts.values()) + alpha * vocab_size
+            log_likelihoods[label] = {f: math.log((c + alpha) / denominator) for f, c in counts.items()}
+            unseen[label] = math.log(alpha / denominator)
+        return cls(log_priors, log_likelihoods, unseen, temperature)
+
+    def scores(self, text: str) -> Dict[str, float]:
+        features = extract_features(text)
+        scores = {}
+        for label in self.labels:
+            likelihoods = self.log_likelihoods[label]
+            missing = self.unseen[label]
+            scores[label] = self.log_priors[label] + sum(likelihoods.get(f, missing) for f in features)
+        return scores
+
+    def probabilities(self, text: str, temperature: Optional[float] = None) -> Dict[str, float]:
+        temperature = temperature or self.temperature
+        scores = self.scores(text)
+        top = max(scores.values())
+        exps = {label: math.exp((score - top) / temperature) for label, score in scores.items()}
+        total = sum(exps.values())
+        return {label: value / total for label, value in exps.items()}
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Most likely department and its calibrated confidence"""
+        probabilities = self.probabilities(text)
+        label = max(probabilities, key=probabilities.get)
+        return label, probabilities[label]
+
+    def calibrate(self, samples: List[Tuple[str, str]]) -> float:
+        """Pick the temperature that minimises negative log likelihood on held-out samples."""
+        best_temperature, best_nll = 1.0, float("inf")
+        for temperature in [0.5, 1, 2, 3, 5, 8, 12, 20, 30, 50]:
+            nll = 0.0
+            for text, label in samples:
+                nll -= math.log(max(self.probabilities(text, temperature).get(label, 0.0), 1e-12))
+            if nll < best_nll:
+                best_temperature, best_nll = temperature, nll
+        self.temperature = best_temperature
+        return best_temperature
+
+    def to_dict(self) -> dict:
+        return {"log_priors": self.log_priors, "log_likelihoods": self.log_likelihoods,
+                "unseen": self.unseen, "temperature": self.temperature}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "NgramRouter":
+        return cls(data["log_priors"], data["log_likelihoods"], data["unseen"], data["temperature"])
+
+_router: Optional[NgramRouter] = None
+_router_loaded = False
+
+def get_router() -> Optional[NgramRouter]:
+    """Load the trained router on first use; None if no model has been trained."""
+    global _router, _router_loaded
+    if not _router_loaded:
+        _router_loaded = True
+        if ROUTER_MODEL_PATH and os.path.exists(ROUTER_MODEL_PATH):
+            try:
+                with open(ROUTER_MODEL_PATH) as f:
+                    _router = NgramRouter.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Warning: Could not load router model from {ROUTER_MODEL_PATH}: {e}")
+    return _router
+
+def route_department(structured_prompt: str) -> Optional[Tuple[str, float]]:
+    """
+    Local routing decision for a feeder output.
+    Returns (department, confidence) when the router is at least
+    ROUTER_CONFIDENCE_THRESHOLD confident, otherwise None.
+    """
+    router = get_router()
+    if router is None:
+        return None
+    started = time.perf_counter()
+    department, confidence = router.predict(structured_prompt)
+    metrics.observe("router.latency_us", (time.perf_counter() - started) * 1e6)
+    if confidence < ROUTER_CONFIDENCE_THRESHOLD:
+        metrics.increment("router.below_threshold")
+        return None
+    return department, confidence
+
+def strict_precheck(request_text: str) -> Optional[str]:
+    """
+    Strict-mode pre-check run before any upstream call, on the raw request text.
+    Returns the department of the first out-of-scope topic word when the request
+    has no in-scope keyword, or None when it should continue down the pipeline.
+    The router model is not used here: it is trained on feeder outputs, not raw requests.
+    """
+    words = _TOKEN_RE.findall(request_text.lower())
+    if not _IN_SCOPE.isdisjoint(words):
+        return None
+    for word in words:
+        department = DEPARTMENT_ALIASES.get(word, word)
+        if department in BUILTIN_DEPARTMENTS or department in _PRECHECK_IN_SCOPE_TOPICS:
+            continue
+        if department in _OUT_OF_SCOPE or profiles.get(department):
+            return department
+    return None
+
+# Training examples are written by a background thread, off the event loop
+_example_log = BackgroundAppender(ROUTER_LOG_PATH) if ROUTER_LOG_PATH else None
+
+def log_example(structured_prompt: str, department: str) -> None:
+    """Queue a feeder output and the interpreter's department for ROUTER_LOG_PATH, for training."""
+    if _example_log is not None:
+        _example_log.append(json.dumps({"text": structured_prompt, "department": department}))
+
+def load_examples(path: str) -> List[Tuple[str, str]]:
+    samples = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                samples.append((record["text"], record["department"]))
+    return samples
+
+def evaluate(router: NgramRouter, samples: List[Tuple[str, str]], threshold: float = ROUTER_CONFIDENCE_THRESHOLD) -> dict:
+    correct = confident = confident_correct = 0
+    started = time.perf_counter()
+    for text, label in samples:
+        predicted, confidence = router.predict(text)
+        correct += predicted == label
+        if confidence >= threshold:
+            confident += 1
+            confident_correct += predicted == label
+    elapsed = time.perf_counter() - started
+    return {
+        "samples": len(samples),
+        "accuracy": correct / len(samples),
+        "threshold": threshold,
+        "coverage": confident / len(samples),
+        "accuracy_above_threshold": confident_correct / confident if confident else None,
+        "latency_us": elapsed / len(samples) * 1e6,
+    }
+
+def print_report(title: str, report: dict) -> None:
+    print(title)
+    print("-" * 60)
+    for key, value in report.items():
+        print(f"  {key:26} {value:.4f}" if isinstance(value, float) else f"  {key:26} {value}")
+
+def train_command(log_path: str, model_path: str) -> None:
+    samples = load_examples(log_path)
+    random.Random(0).shuffle(samples)
+    split = max(1, int(len(samples) * 0.8))
+    train_set, held_out = samples[:split], samples[split:] or samples[:split]
+    calibration_split = max(1, int(len(train_set) * 0.8))
+
+    started = time.perf_counter()
+    router = NgramRouter.train(train_set[:calibration_split])
+    temperature = router.calibrate(train_set[calibration_split:] or train_set)
+    router = NgramRouter.train(train_set, temperature=temperature)
+    print(f"Trained on {len(train_set)} examples, {len(router.labels)} departments, "
+          f"temperature {temperature} ({(time.perf_counter() - started) * 1000:.0f} ms)")
+    print_report("\nHeld-out evaluation", evaluate(router, held_out))
+
+    # Ship a model trained on everything with the calibrated temperature
+    router = NgramRouter.train(samples, temperature=temperature)
+    with open(model_path, "w") as f:
+        json.dump(router.to_dict(), f)
+    print(f"\nSaved model to {model_path}")
+
+def eval_command(log_path: str, model_path: str) -> None:
+    with open(model_path) as f:
+        router = NgramRouter.from_dict(json.load(f))
+    print_report(f"Evaluation of {model_path}", evaluate(router, load_examples(log_path)))
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("train", "eval"):
+        print(__doc__)
+        sys.exit(1)
+    model = sys.argv[3] if len(sys.argv) > 3 else ROUTER_MODEL_PATH
+    if sys.argv[1] == "train":
+        train_command(sys.argv[2], model)
+    else:
+        eval_command(sys.argv[2], model)
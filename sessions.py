@@ -0,0 +1,50 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+from config import SESSION_MAX_ENTRIES, SESSION_TTL_SECONDS
+
+class SessionStore:
+    """
+    Bounded, expiring store of the last gittertalk per session.
+    Entries expire SESSION_TTL_SECONDS after their last write; once full,
+    the least recently used session is evicted.
+    """
+
+    def __init__(self, max_entries: int = SESSION_MAX_ENTRIES, ttl_seconds: float = SESSION_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            if entry["expires_at"] < time.monotonic():
+                del self._entries[session_id]
+                return None
+            self._entries.move_to_end(session_id)
+            return entry
+
+    def put(self, session_id: str, gittertalk_obj, department: str, fresh_input_tokens: int) -> dict:
+        """Store the latest state for a session and return the stored entry."""
+        with self._lock:
+            previous = self._entries.pop(session_id, None)
+            entry = {
+                "gittertalk": gittertalk_obj,
+                "department": department,
+                "fresh_input_tokens": fresh_input_tokens,
+                "turn": previous["turn"] + 1 if previous else 1,
+                "expires_at": time.monotonic() + self.ttl_seconds,
+            }
+            self._entries[session_id] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+sessions = SessionStore()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark - time to import main and time to first served request,
+each measured in a fresh interpreter against the local upstream stand-in
+"""
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+async def asgi_request(app, method: str, path: str, payload=None):
+    """Drive one HTTP request through an ASGI app in-process. Returns (status, json body)."""
+    body = json.dumps(payload).encode() if payload is not None else b""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "scheme": "http", "server": ("testserver", 80), "client": ("127.0.0.1", 0),
+        "headers": [(b"host", b"testserver"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode())],
+    }
+    received = False
+    status = None
+    chunks = []
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    raw = b"".join(chunks)
+    return status, json.loads(raw) if raw else None
+
+def child(mode: str) -> None:
+    """Runs inside a fresh interpreter and prints timings as JSON"""
+    started = time.perf_counter()
+    import main
+    timings = {"import_ms": (time.perf_counter() - started) * 1000}
+    if mode == "import":
+        print(json.dumps(timings))
+        return
+
+    from config import set_openai_client
+    from stub_upstream import StubUpstream
+    set_openai_client(StubUpstream())
+    if mode == "warm":
+        from warmup import warm_up
+        warm_started = time.perf_counter()
+        warm_up()
+        timings["warmup_ms"] = (time.perf_counter() - warm_started) * 1000
+
+    request_started = time.perf_counter()
+    status, _ = asyncio.run(asgi_request(main.app, "POST", "/process", {"request": "Book a flight to Denver"}))
+    timings["first_request_ms"] = (time.perf_counter() - request_started) * 1000
+    timings["total_ms"] = (time.perf_counter() - started) * 1000
+    timings["status"] = status
+    print(json.dumps(timings))
+
+def run(mode: str, runs: int) -> list:
+    env = dict(os.environ)
+    env.pop("OPENAI_API_KEY", None)  # importing must not need credentials
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, __file__, "--child", mode], capture_output=True, text=True, env=env,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return results
+
+def report(label: str, results: list) -> None:
+    print(f"\n{label}")
+    print("-" * 60)
+    for key in ("import_ms", "warmup_ms", "first_request_ms", "total_ms"):
+        values = [r[key] for r in results if key in r]
+        if values:
+            print(f"  {key:18} median {statistics.median(values):8.1f}  min {min(values):8.1f}  max {max(values):8.1f}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        child(sys.argv[2])
+        sys.exit(0)
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print("COLD START BENCHMARK")
+    print("=" * 60)
+    report("import main (no OPENAI_API_KEY)", run("import", runs))
+    report("import + first /process request", run("first", runs))
+    report("import + warm_up() + first /process request", run("warm", runs))
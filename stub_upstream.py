@@ -0,0 +1,98 @@
+"""
+Local stand-in for the OpenAI chat completions API.
+Answers feeder, interpreter and department prompts with deterministic canned
+replies after a configurable latency, so the pipeline can be benchmarked
+without network access or API spend.
+
+    from config import set_openai_client
+    from stub_upstream import StubUpstream
+    set_openai_client(StubUpstream(latency=0.05))
+"""
+import asyncio
+import json
+import random
+import re
+from types import SimpleNamespace
+
+# keyword -> (act, obj, department) used to fake interpreter routing
+_ROUTES = [
+    (("flight", "fly", "airport"), ("flight", "Flight", "travel")),
+    (("hotel", "room", "stay"), ("hotel", "Hotel", "travel")),
+    (("car", "rental"), ("car", "Car", "travel")),
+    (("route", "highway", "directions", "drive"), ("route", "directions", "travel")),
+    (("news", "stock", "happening", "headline"), ("news", "News", "news")),
+    (("joke", "funny", "laugh"), ("joke", "Joke", "joke")),
+    (("weather", "forecast", "rain"), ("get", "forecast", "weather")),
+    (("recipe", "cook", "bake"), ("find", "recipe", "cooking")),
+]
+
+def classify(text: str):
+    """Keyword routing for the stand-in interpreter: returns (act, obj, department)."""
+    lowered = text.lower()
+    for keywords, route in _ROUTES:
+        if any(keyword in lowered for keyword in keywords):
+            return route
+    return "get", "information", "other"
+
+def _message(content: str, prompt_text: str, max_tokens=None):
+    completion_tokens = max(len(content) // 4, 1)
+    finish_reason = "stop"
+    if max_tokens is not None and completion_tokens > max_tokens:
+        content = content[:max_tokens * 4]
+        completion_tokens = max_tokens
+        finish_reason = "length"
+    return SimpleNamespace(
+        choices=[SimpleNamespace(finish_reason=finish_reason, message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(prompt_tokens=max(len(prompt_text) // 4, 1), completion_tokens=completion_tokens),
+    )
+
+class _Completions:
+    def __init__(self, upstream: "StubUpstream"):
+        self._upstream = upstream
+
+    async def create(self, model: str, messages: list, max_tokens=None, **kwargs):
+        upstream = self._upstream
+        upstream.calls += 1
+        delay = upstream.latency + upstream.rng.uniform(0, upstream.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if upstream.error_rate and upstream.rng.random() < upstream.error_rate:
+            raise RuntimeError("stub upstream error")
+
+        system = messages[0]["content"]
+        user = messages[1]["content"] if len(messages) > 1 else ""
+        prompt_text = system + user
+        return _message(upstream.reply(system, user), prompt_text, max_tokens)
+
+class StubUpstream:
+    """
+    Drop-in for the AsyncOpenAI client used by feeder, interpreter and departments.
+    latency/jitter are in seconds; error_rate is the fraction of calls that raise.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def reply(self, system: str, user: str) -> str:
+        if system.startswith("You are the Feeder"):
+            act, obj, _ = classify(user)
+            return f"Intent: {act}\nObject: {obj}\nParameters: {user}"
+        if system.startswith("State:"):
+            return json.dumps({"set": {"note": user[:40]}})
+        if system.startswith("Convert the request to JSON"):
+            act, obj, department = classify(user)
+            return json.dumps({"a": act, "o": obj, "p": {}, "d": department})
+        if system.startswith("You are the Interpreter"):
+            act, obj, department = classify(user)
+            return f"gittertalk:act:{act};obj:{obj}\nDEPARTMENT:{department}"
+        # Department prompt: a fixed-size answer that budgets can truncate
+        items = re.findall(r"^### (\d+)$", user, re.MULTILINE)
+        if items:
+            # Batched department call: one answer per numbered item
+            return "\n".join(f"### {item}\n" + "Here is a helpful answer. " * 20 for item in items)
+        return "Here is a helpful answer. " * 20
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tests for department micro-batching: splitting batched replies, the fallback to
+individual calls, truncated batches and per-submitter token attribution
+
+    python -m pytest test_batching.py
+"""
+import asyncio
+from types import SimpleNamespace
+import pytest
+import config
+import metrics
+import tracing
+from batching import MicroBatcher, _share
+from departments import run_department_batch, split_batch_answers
+from stub_upstream import StubUpstream
+
+class ScriptedUpstream:
+    """Upstream stand-in replying with scripted (content, completion_tokens, finish_reason) in order"""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=self)
+
+    async def create(self, model, messages, max_tokens=None, **kwargs):
+        self.requests.append({"messages": messages, "max_tokens": max_tokens})
+        content, completion_tokens, finish_reason = self.replies.pop(0)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(finish_reason=finish_reason, message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=completion_tokens),
+        )
+
+@pytest.fixture(autouse=True)
+def restore_client():
+    yield
+    config.set_openai_client(None)
+
+def test_split_in_order():
+    assert split_batch_answers("### 1\nfirst\n### 2\nsecond", 2) == ["first", "second"]
+
+def test_split_rejects_out_of_order_missing_and_empty_markers():
+    assert split_batch_answers("### 2\nsecond\n### 1\nfirst", 2) is None
+    assert split_batch_answers("### 1\nfirst\n### 3\nthird", 3) is None
+    assert split_batch_answers("### 1\nfirst", 2) is None
+    assert split_batch_answers("### 1\n\n### 2\nsecond", 2) is None
+    assert split_batch_answers("no markers at all", 1) is None
+
+def test_batch_is_one_upstream_call():
+    stub = StubUpstream()
+    config.set_openai_client(stub)
+    items = [("act:flt;obj:Flt;to:Denver", 200), ("act:flt;obj:Flt;to:Miami", 200), ("act:htl;obj:Htl", 200)]
+    results = asyncio.run(run_department_batch("travel", items))
+    assert stub.calls == 1
+    assert len(results) == 3
+    assert all(answer.startswith("Here is a helpful answer") for answer, _ in results)
+    assert all(0 < used < 200 for _, used in results)
+
+def test_unsplittable_reply_falls_back_to_individual_calls():
+    upstream = ScriptedUpstream([
+        ("### 2\nsecond\n### 1\nfirst", 20, "stop"),
+        ("answer one", 5, "stop"),
+        ("answer two", 6, "stop"),
+    ])
+    config.set_openai_client(upstream)
+    results = asyncio.run(run_department_batch("news", [("act:news;obj:News", 100), ("act:news;obj:News;topic:x", 100)]))
+    assert results == [("answer one", 5), ("answer two", 6)]
+    assert len(upstream.requests) == 3
+    # The individual calls carry each item's own budget
+    assert [request["max_tokens"] for request in upstream.requests] == [200, 100, 100]
+
+def test_truncated_batch_marks_every_item_as_using_its_budget():
+    upstream = ScriptedUpstream([("### 1\nfirst answer\n### 2\nsecond ans", 90, "length")])
+    config.set_openai_client(upstream)
+    results = asyncio.run(run_department_batch("joke", [("act:joke;obj:Joke", 40), ("act:joke;obj:Joke;type:pun", 50)]))
+    assert results == [("first answer", 40), ("second ans", 50)]
+
+def test_share_splits_evenly_and_sums_to_total():
+    for total in (0, 1, 10, 101):
+        for count in (1, 3, 7):
+            shares = [_share(total, index, count) for index in range(count)]
+            assert sum(shares) == total
+            assert max(shares) - min(shares) <= 1
+
+def test_submitters_each_get_a_share_of_batch_usage_and_spans():
+    async def run_batch(key, items):
+        with tracing.span("upstream", "client", stage="department"):
+            metrics.record_usage("department", SimpleNamespace(prompt_tokens=31, completion_tokens=100))
+        return [f"answer {item}" for item in items]
+
+    async def submitter(batcher, item):
+        ledger = metrics.begin_request_usage()
+        trace = tracing.begin_trace()
+        with tracing.span("pipeline"):
+            result = await batcher.submit("travel", item)
+        return result, ledger, trace
+
+    async def main():
+        batcher = MicroBatcher(window_ms=20, max_size=8, run_batch=run_batch)
+        return await asyncio.gather(*(submitter(batcher, item) for item in range(3)))
+
+    outcomes = asyncio.run(main())
+    assert [result for result, _, _ in outcomes] == ["answer 0", "answer 1", "answer 2"]
+    ledgers = [ledger["department"] for _, ledger, _ in outcomes]
+    assert sum(entry["prompt_tokens"] for entry in ledgers) == 31
+    assert sum(entry["completion_tokens"] for entry in ledgers) == 100
+    assert {entry["completion_tokens"] for entry in ledgers} == {33, 34}
+    for _, _, trace in outcomes:
+        spans = {span.name: span for span in trace.spans}
+        assert spans["upstream"].attributes["batch_size"] == 3
+        assert spans["upstream"].parent_id == spans["batch.wait"].span_id
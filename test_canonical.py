@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Tests for gittertalk canonicalization: relative date resolution and location aliasing
+
+    python -m pytest test_canonical.py
+"""
+from datetime import date
+from canonical import canonical_date, canonical_location, canonicalize, resolve_date
+from gittertalk import CompactGittertalk
+
+WEDNESDAY = date(2024, 1, 3)
+SUNDAY = date(2024, 1, 7)
+
+def test_relative_days():
+    assert resolve_date("today", WEDNESDAY) == "2024-01-03"
+    assert resolve_date("tomorrow", WEDNESDAY) == "2024-01-04"
+    assert resolve_date("+3", WEDNESDAY) == "2024-01-06"
+    assert resolve_date("in 2 weeks", WEDNESDAY) == "2024-01-17"
+    assert resolve_date("3 days", WEDNESDAY) == "2024-01-06"
+
+def test_bare_number_is_not_a_date():
+    assert resolve_date("10", WEDNESDAY) is None
+    assert canonical_date("10", WEDNESDAY) == "10"
+
+def test_weekday_wraps_to_next_week():
+    assert resolve_date("friday", WEDNESDAY) == "2024-01-05"
+    assert resolve_date("monday", WEDNESDAY) == "2024-01-08"
+    assert resolve_date("wednesday", WEDNESDAY) == "2024-01-03"
+    assert resolve_date("monday", SUNDAY) == "2024-01-08"
+
+def test_next_weekday():
+    assert resolve_date("next friday", WEDNESDAY) == "2024-01-05"
+    assert resolve_date("next wednesday", WEDNESDAY) == "2024-01-10"
+    assert resolve_date("next sunday", SUNDAY) == "2024-01-14"
+
+def test_next_week_starts_on_monday():
+    assert resolve_date("next week", WEDNESDAY) == "2024-01-08"
+    assert resolve_date("next week", SUNDAY) == "2024-01-08"
+    assert resolve_date("this week", WEDNESDAY) is None
+
+def test_weekend_and_time_of_day():
+    assert resolve_date("weekend", WEDNESDAY) == "2024-01-06"
+    assert canonical_date("next friday evening", WEDNESDAY) == "2024-01-05 evening"
+
+def test_location_aliases():
+    assert canonical_location("NYC") == canonical_location("New York City")
+    assert canonical_location("LAX") == "Los Angeles"
+    assert canonical_location("Columbus, Ohio") == "Columbus, OH"
+    assert canonical_location("columbus, oh") == "Columbus, OH"
+
+def test_unknown_region_is_kept():
+    assert canonical_location("Toronto, Canada") == "Toronto, Canada"
+    assert canonical_location("Vienna, Austria") == "Vienna, Austria"
+    assert canonical_location("Sydney, Australia") == "Sydney, Australia"
+    assert canonical_location("Tokyo, Japan") == "Tokyo, Japan"
+
+def test_equivalent_requests_share_a_canonical_form():
+    first = CompactGittertalk("Flight", "Flight", (("to", "LAX"), ("when", "Tomorrow")))
+    second = CompactGittertalk("flight", "flight", (("when", "tomorrow"), ("to", "los angeles")))
+    assert canonicalize(first, WEDNESDAY) == canonicalize(second, WEDNESDAY)
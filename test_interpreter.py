@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for parsing structured interpreter replies and session deltas
+
+    python -m pytest test_interpreter.py
+"""
+from gittertalk import CompactGittertalk, apply_delta
+from interpreter import parse_delta_response, parse_structured_response, repair_structured_response
+
+FLIGHT = (CompactGittertalk("flight", "Flight", (("to", "Denver"),)), "travel")
+NEWS = (CompactGittertalk("news", "News", ()), "news")
+
+def test_valid_reply_parses():
+    assert parse_structured_response('{"a":"flight","o":"Flight","p":{"to":"Denver"},"d":"travel"}') == [FLIGHT]
+
+def test_code_fenced_reply_is_repaired():
+    content = 'Sure:\n```json\n{"a":"flight","o":"Flight","p":{"to":"Denver"},"d":"travel"}\n```'
+    assert parse_structured_response(content) is None
+    assert repair_structured_response(content) == [FLIGHT]
+
+def test_truncated_intent_list_keeps_complete_intents():
+    content = ('{"i":[{"a":"flight","o":"Flight","p":{"to":"Denver"},"d":"travel"},'
+               '{"a":"news","o":"News","p":{},"d":"news"},{"a":"joke","o":"Jo')
+    assert repair_structured_response(content) == [FLIGHT, NEWS]
+
+def test_truncated_intent_list_with_no_complete_intent():
+    assert repair_structured_response('{"i":[{"a":"flight","o":"Flight","p":{"to":"Den') is None
+
+def test_truncated_single_object_is_not_repaired():
+    assert repair_structured_response('{"a":"flight","o":"Flight","p":{"to":"Denver"},"d":"tra') is None
+    assert repair_structured_response('{"a":"flight","o":"Flight","p":{"to":"Den') is None
+
+def test_escaped_quotes_inside_values():
+    content = '{"i":[{"a":"flight","o":"Flight","p":{"to":"De\\"nver"},"d":"travel"},{"a":"x'
+    assert repair_structured_response(content) == [
+        (CompactGittertalk("flight", "Flight", (("to", 'De"nver'),)), "travel")
+    ]
+
+def test_nested_values_are_rejected():
+    content = '{"a":"flight","o":"Flight","p":{"to":{"city":"Denver"}},"d":"travel"}'
+    assert parse_structured_response(content) is None
+    assert repair_structured_response(content) is None
+    assert parse_structured_response('{"a":"flight","o":"Flight","p":{"to":["Denver"]},"d":"travel"}') is None
+    assert parse_structured_response('{"a":"flight","o":"Flight","p":{"to":null},"d":"travel"}') is None
+
+def test_missing_fields_are_rejected():
+    assert parse_structured_response('{"a":"flight","o":"Flight","p":{}}') is None
+    assert parse_structured_response('{"i":[]}') is None
+    assert repair_structured_response("no json here") is None
+
+def test_delta_sets_and_deletes_params():
+    previous = CompactGittertalk("flight", "Flight", (("from", "Columbus"), ("to", "Denver"), ("when", "today")))
+    delta = parse_delta_response('{"set":{"when":"friday","class":"business"},"del":["from"]}')
+    assert delta == {"set": {"when": "friday", "class": "business"}, "del": ["from"]}
+    assert apply_delta(previous, delta) == CompactGittertalk(
+        "flight", "Flight", (("to", "Denver"), ("when", "friday"), ("class", "business"))
+    )
+
+def test_delta_changes_act_object_and_department():
+    delta = parse_delta_response('{"a":"hotel","o":"Hotel","d":" Travel "}')
+    assert delta == {"a": "hotel", "o": "Hotel", "d": "travel"}
+    merged = apply_delta(CompactGittertalk("flight", "Flight", (("to", "Denver"),)), delta)
+    assert merged == CompactGittertalk("hotel", "Hotel", (("to", "Denver"),))
+
+def test_delta_deleting_a_missing_param_is_harmless():
+    previous = CompactGittertalk("flight", "Flight", (("to", "Denver"),))
+    assert apply_delta(previous, parse_delta_response('{"del":["class"]}')) == previous
+    assert parse_delta_response("{}") == {}
+
+def test_malformed_deltas_are_rejected():
+    assert parse_delta_response("not json") is None
+    assert parse_delta_response('["set"]') is None
+    assert parse_delta_response('{"a":""}') is None
+    assert parse_delta_response('{"set":["when"]}') is None
+    assert parse_delta_response('{"del":"from"}') is None
+    assert parse_delta_response('{"set":{"when":{"day":"friday"}}}') is None
+    assert parse_delta_response('{"set":{"when":null}}') is None
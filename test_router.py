@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Tests for the strict-mode pre-check
+
+    python -m pytest test_router.py
+"""
+import pytest
+import router
+
+@pytest.fixture(autouse=True)
+def no_profiles(monkeypatch):
+    # Promoted profiles come from DEPARTMENT_PROFILES_PATH; keep them out unless a test adds one
+    monkeypatch.setattr(router.profiles, "get", lambda name: None)
+
+def test_in_scope_requests_continue():
+    assert router.strict_precheck("Book a flight from Columbus to Denver tomorrow") is None
+    assert router.strict_precheck("What's happening in the news today?") is None
+    assert router.strict_precheck("Tell me a funny joke") is None
+
+def test_out_of_scope_requests_are_rejected():
+    assert router.strict_precheck("What's the weather forecast for Seattle?") == "weather"
+    assert router.strict_precheck("Give me a pasta recipe") == "cooking"
+
+def test_first_out_of_scope_word_names_the_department():
+    assert router.strict_precheck("a recipe to eat while checking the weather") == "cooking"
+    assert router.strict_precheck("the weather while I try a recipe") == "weather"
+
+def test_entertainment_reaches_the_interpreter():
+    assert router.strict_precheck("any good movies playing tonight?") is None
+    assert router.strict_precheck("recommend a film for tonight") is None
+    assert router.strict_precheck("play some music") is None
+
+def test_ambiguous_requests_continue():
+    # An in-scope keyword wins over an out-of-scope topic
+    assert router.strict_precheck("what's the weather for my flight to Denver") is None
+    # No topic word either way
+    assert router.strict_precheck("hello there") is None
+
+def test_promoted_profile_is_rejected(monkeypatch):
+    monkeypatch.setattr(router.profiles, "get", lambda name: {"name": name} if name == "gardening" else None)
+    assert router.strict_precheck("gardening tips for spring") == "gardening"
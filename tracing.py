@@ -0,0 +1,190 @@
+"""
+Per-request tracing: a trace id per /process request and timed spans for the
+pipeline stages, cache lookups and upstream calls.
+
+Finished traces can be appended to TRACE_EXPORT_PATH as OTLP/JSON (one
+ExportTraceServiceRequest per line), which OpenTelemetry collectors and most
+trace viewers can import. With "debug": true, /process returns the span
+timeline inline.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import List, Optional
+from appendlog import BackgroundAppender
+from config import TRACE_EXPORT_PATH, TRACING_SERVICE_NAME
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+# Exported traces are written by a background thread, off the event loop
+_exporter = BackgroundAppender(TRACE_EXPORT_PATH) if TRACE_EXPORT_PATH else None
+
+# OTLP span kinds and status codes
+_KINDS = {"internal": 1, "client": 3}
+_STATUS_OK, _STATUS_ERROR = 1, 2
+
+class Span:
+    __slots__ = ("name", "kind", "span_id", "parent_id", "start_ns", "duration_ns", "attributes", "error")
+
+    def __init__(self, name: str, kind: str, parent_id: Optional[str], attributes: dict):
+        self.name = name
+        self.kind = kind
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.duration_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def set_usage(self, usage) -> None:
+        """Token counts from an upstream usage object"""
+        if usage is not None:
+            self.attributes["prompt_tokens"] = usage.prompt_tokens
+            self.attributes["completion_tokens"] = usage.completion_tokens
+
+class _NoopSpan:
+    """Returned outside a trace so callers never need to check"""
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def set_usage(self, usage) -> None:
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class Trace:
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+
+    def timeline(self) -> dict:
+        """Spans in start order with offsets from the trace start, for inline debugging"""
+        if not self.spans:
+            return {"trace_id": self.trace_id, "spans": []}
+        origin = min(span.start_ns for span in self.spans)
+        spans = []
+        for span in sorted(self.spans, key=lambda s: s.start_ns):
+            entry = {
+                "name": span.name,
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "start_ms": round((span.start_ns - origin) / 1e6, 3),
+                "duration_ms": round(span.duration_ns / 1e6, 3),
+                "attributes": span.attributes,
+            }
+            if span.error:
+                entry["error"] = span.error
+            spans.append(entry)
+        return {"trace_id": self.trace_id, "spans": spans}
+
+    def to_otlp(self) -> dict:
+        """OTLP/JSON ExportTraceServiceRequest for this trace"""
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", TRACING_SERVICE_NAME)]},
+            "scopeSpans": [{
+                "scope": {"name": "transdepo"},
+                "spans": [_otlp_span(self.trace_id, span) for span in self.spans],
+            }],
+        }]}
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+def _otlp_span(trace_id: str, span: Span) -> dict:
+    otlp = {
+        "traceId": trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": _KINDS[span.kind],
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.start_ns + span.duration_ns),
+        "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+        "status": {"code": _STATUS_ERROR, "message": span.error} if span.error else {"code": _STATUS_OK},
+    }
+    if span.parent_id:
+        otlp["parentSpanId"] = span.parent_id
+    return otlp
+
+def begin_trace() -> Trace:
+    """Start a trace for the current request and return it."""
+    trace = Trace()
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+def end_trace(trace: Trace) -> None:
+    """Queue a finished trace for export to TRACE_EXPORT_PATH when configured."""
+    if _exporter is not None:
+        _exporter.append(json.dumps(trace.to_otlp(), separators=(",", ":")))
+
+def flush_exports() -> None:
+    """Wait until every finished trace has been written to TRACE_EXPORT_PATH."""
+    if _exporter is not None:
+        _exporter.flush()
+
+def current_span():
+    """Innermost open span, or a no-op span outside a trace"""
+    return _current_span.get() or _NOOP_SPAN
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """Time a block as a child of the current span; a no-op outside a trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield _NOOP_SPAN
+        return
+    parent = _current_span.get()
+    current = Span(name, kind, parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    started = time.perf_counter_ns()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration_ns = time.perf_counter_ns() - started
+        _current_span.reset(token)
+        trace.spans.append(current)
+
+def adopt(spans: List[Span], **attributes) -> None:
+    """
+    Copy finished spans from another trace (e.g. a shared batch call) into the
+    current one, under the current span; a no-op outside a trace.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    parent = _current_span.get()
+    span_ids = {span.span_id: os.urandom(8).hex() for span in spans}
+    for span in spans:
+        copy = Span(span.name, span.kind, span_ids.get(span.parent_id) or (parent.span_id if parent else None),
+                    dict(span.attributes, **attributes))
+        copy.span_id = span_ids[span.span_id]
+        copy.start_ns = span.start_ns
+        copy.duration_ns = span.duration_ns
+        copy.error = span.error
+        trace.spans.append(copy)
+
+def traced(name: str):
+    """Decorator running an async function inside a span"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
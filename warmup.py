@@ -0,0 +1,37 @@
+import time
+from typing import Dict
+from config import MODEL_DEPARTMENT, get_openai_client
+
+def warm_up() -> Dict[str, float]:
+    """
+    Pre-build everything the first request would otherwise pay for:
+    the upstream client, gittertalk codec tables and location caches, and the tokenizer.
+    Returns the time spent on each step in milliseconds.
+    """
+    from gazetteer import MAJOR_CITIES
+    from gittertalk import gittertalk, gittertalk_to_string, stenographic_location
+    
+    timings = {}
+    
+    started = time.perf_counter()
+    get_openai_client()
+    timings["client_ms"] = (time.perf_counter() - started) * 1000
+    
+    started = time.perf_counter()
+    sample = gittertalk(act="flight", obj="Flight", params={"from": "Columbus", "to": "Denver", "when": "+1"})
+    for level in (1, 2, 4):
+        gittertalk_to_string(sample, level)
+    for city in MAJOR_CITIES:
+        stenographic_location(city.title())
+    timings["codec_ms"] = (time.perf_counter() - started) * 1000
+    
+    started = time.perf_counter()
+    try:
+        import tiktoken
+        tiktoken.encoding_for_model(MODEL_DEPARTMENT)
+    except Exception as e:
+        # Tokenizer is optional - it may be missing or unable to fetch its tables offline
+        print(f"Warning: tokenizer warm-up skipped: {e}")
+    timings["tokenizer_ms"] = (time.perf_counter() - started) * 1000
+    
+    return timings